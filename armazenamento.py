@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Base final compacta: tabela de fatos com chaves inteiras e uma tabela de dimensão por coluna de texto
+nome_fatos = 'fatos.parquet'
+colunas_dimensao = ['REGIAO_PAIS', 'CID_TIPO', 'SEXO', 'BENEF_TIPO', 'STATUS_BENEFICIARIO', 'IDADE_FAIXA']
+compressao = 'zstd'
+
+
+def caminho_dimensao(pasta, coluna):
+    return Path(pasta) / f'{coluna.lower()}.parquet'
+
+
+def _tipo_chave(quantidade):
+    return np.int8 if quantidade < 2**7 else np.int16 if quantidade < 2**15 else np.int32
+
+
+def codificar_meses(meses):
+    """Índice inteiro do mês (ano * 12 + mês - 1), o mesmo usado pelo motor de filtros."""
+    meses = pd.to_datetime(meses)
+    if not (meses.dt.day == 1).all():
+        raise ValueError("A coluna MES deve conter apenas o primeiro dia de cada mês.")
+    return (meses.dt.year * 12 + meses.dt.month - 1).astype(np.int16)
+
+
+def decodificar_meses(codigos):
+    codigos = np.asarray(codigos, dtype=np.int64)
+    return pd.to_datetime(pd.DataFrame({'year': codigos // 12, 'month': codigos % 12 + 1, 'day': 1}))
+
+
+def _codificar(valores):
+    # Códigos pela ordem alfabética dos rótulos; a conversão para texto e a ordenação são feitas só nos valores distintos
+    codigos, unicos = pd.factorize(valores)
+    rotulos = np.asarray(unicos, dtype=object).astype(str)
+    ordem = np.argsort(rotulos, kind='stable')
+    posicoes = np.empty(len(ordem), dtype=np.int64)
+    posicoes[ordem] = np.arange(len(ordem))
+    chaves = np.where(codigos >= 0, posicoes[codigos], -1).astype(_tipo_chave(len(rotulos)))
+    return chaves, rotulos[ordem]
+
+
+def salvar_base_compacta(base_tratada, pasta):
+    """Grava a base final como tabela de fatos (chaves int8/int16, MES int16, QTD int32) e tabelas de dimensão.
+
+    Os rótulos de cada dimensão ficam ordenados, e a população fica na tabela de regiões
+    em vez de se repetir em cada linha; a taxa é recalculada na leitura.
+    """
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+
+    fatos = pd.DataFrame({'MES': codificar_meses(base_tratada['MES']).to_numpy()})
+    for coluna in colunas_dimensao:
+        chaves, rotulos = _codificar(base_tratada[coluna])
+        dimensao = pd.DataFrame({'ID': np.arange(len(rotulos), dtype=chaves.dtype), coluna: rotulos})
+        if coluna == 'REGIAO_PAIS' and 'POPULACAO' in base_tratada.columns:
+            # A população é a mesma em todas as linhas da região: basta a primeira linha de cada uma
+            presentes, primeiras = np.unique(chaves, return_index=True)
+            populacao = pd.to_numeric(base_tratada['POPULACAO'].iloc[primeiras[presentes >= 0]], errors='coerce').fillna(0)
+            dimensao['POPULACAO'] = np.zeros(len(rotulos), dtype=np.int64)
+            dimensao.loc[presentes[presentes >= 0], 'POPULACAO'] = populacao.to_numpy(dtype=np.int64)
+        dimensao.to_parquet(caminho_dimensao(pasta, coluna), index=False, compression=compressao)
+        fatos[coluna] = chaves
+
+    fatos['QTD_BENEFICIOS'] = base_tratada['QTD_BENEFICIOS'].to_numpy(dtype=np.int32)
+    fatos.to_parquet(caminho_fatos(pasta), index=False, compression=compressao)
+
+
+def caminho_fatos(pasta):
+    return Path(pasta) / nome_fatos
+
+
+def existe_base_compacta(pasta):
+    return caminho_fatos(pasta).exists()
+
+
+def ler_base_compacta(pasta):
+    """Lê a base compacta no mesmo formato devolvido por carregamento.ler_base_final."""
+    pasta = Path(pasta)
+    fatos = pd.read_parquet(caminho_fatos(pasta))
+    dimensoes = {coluna: pd.read_parquet(caminho_dimensao(pasta, coluna)) for coluna in colunas_dimensao}
+
+    # Cada mês distinto é convertido uma única vez e espalhado pelas linhas
+    codigos_meses, posicoes_meses = np.unique(fatos['MES'].to_numpy(), return_inverse=True)
+    meses = decodificar_meses(codigos_meses)
+    base = pd.DataFrame({'MES': meses.to_numpy()[posicoes_meses]})
+
+    for coluna, dimensao in dimensoes.items():
+        # As chaves são as posições dos rótulos, então as categorias saem direto dos códigos
+        base[coluna] = pd.Categorical.from_codes(fatos[coluna].to_numpy(), categories=dimensao[coluna].to_numpy())
+
+    base['QTD_BENEFICIOS'] = fatos['QTD_BENEFICIOS'].astype(np.int64)
+    regioes = dimensoes['REGIAO_PAIS']
+    if 'POPULACAO' in regioes.columns:
+        codigos_regiao = fatos['REGIAO_PAIS'].to_numpy()
+        base['POPULACAO'] = np.where(codigos_regiao >= 0, regioes['POPULACAO'].to_numpy()[codigos_regiao], 0)
+        base['TAXA_BENEFICIOS'] = (base['QTD_BENEFICIOS'] / base['POPULACAO']) * 100000
+    base['MES_STR'] = pd.Categorical.from_codes(posicoes_meses, categories=meses.dt.strftime('%Y-%m').to_numpy())
+    return base
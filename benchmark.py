@@ -0,0 +1,270 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import graficos
+from armazenamento import ler_base_compacta, salvar_base_compacta
+from carregamento import ler_base_final
+from cubo import dimensao_total, dimensoes_graficos, fatiar_cubo, gerar_cubo, indexar_cubo
+from dados_sinteticos import gerar_base_mensal, gerar_bases, meses_sinteticos, nome_arquivo_mes
+from detalhamento import consultar_detalhe, gravar_detalhe, motor_padrao, niveis_detalhe
+from ingestao import gravar_base_bruta, juntar_particoes, ler_arquivo_excel, ler_lotes, ler_lotes_parquet, somar_contagens
+from tratamento import agregar_base, colunas_desejadas, etapas_tratamento, tratar_base
+
+# Gráficos do dashboard medidos um a um, na ordem em que aparecem na página
+figuras_dashboard = {
+    'rosca_regiao': graficos.figura_rosca_regiao,
+    'tipo_beneficio': graficos.figura_tipo_beneficio,
+    'pareto_status': graficos.figura_pareto_status,
+    'faixa_etaria': graficos.figura_faixa_etaria,
+    'taxa_regiao': graficos.figura_taxa_regiao,
+    'taxa_mes_sexo': graficos.figura_taxa_mes_sexo,
+}
+
+
+class Cronometro:
+    """Acumula o tempo de cada etapa; etapas repetidas na mesma execução (ex.: uma por mês) são somadas."""
+
+    def __init__(self):
+        self.tempos = defaultdict(float)
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tempos[etapa] += time.perf_counter() - inicio
+
+
+def estados_filtro(motor):
+    """Filtros medidos no dashboard: sem seleção (página inicial) e uma seleção parcial típica."""
+    total = motor.particao(dimensao_total)
+    meses = pd.to_datetime(total['MES'])
+    inicio, fim = meses.min().to_period('M'), meses.max().to_period('M')
+    regioes = sorted(total['REGIAO_PAIS'].dropna().unique())[:2]
+    cids = sorted(total['CID_TIPO'].dropna().unique())[:3]
+    return {
+        'todos': graficos.normalizar_filtros(inicio, fim, [], []),
+        'selecao': graficos.normalizar_filtros(max(inicio, fim - 2), fim, regioes, cids),
+    }
+
+
+def medir_pipeline(cronometro, linhas, meses, semente, pasta, excel=False, tamanho_lote=None):
+    """Ingestão, tratamento e agregação mês a mês, e exportação da base final em CSV.
+
+    Com tamanho_lote, cada mês é lido, tratado e contado em lotes, como em ingestao.agregar_em_lotes.
+    As linhas tratadas também são gravadas na base de detalhamento, ao lado do CSV.
+    """
+    particoes = []
+    linhas_tratadas = 0
+    for mes, base_gerada in gerar_bases(linhas, meses, semente):
+        caminho = pasta / nome_arquivo_mes(mes, '.parquet')
+        with cronometro.medir('ingestao.gravar_parquet'):
+            gravar_base_bruta(base_gerada, caminho)
+        if excel:
+            caminho_excel = pasta / nome_arquivo_mes(mes, '.xlsx')
+            base_gerada.to_excel(caminho_excel, index=False)
+            with cronometro.medir('ingestao.ler_excel'):
+                ler_arquivo_excel(caminho_excel, usar_cache=False)
+        lotes = ler_lotes_parquet(caminho, tamanho_lote or max(len(base_gerada), 1), separar_mistas=True)
+        del base_gerada
+
+        contagens = []
+        parte = 0
+        while True:
+            with cronometro.medir('ingestao.ler_parquet'):
+                base = next(lotes, None)
+            if base is None:
+                break
+            for etapa in etapas_tratamento:
+                with cronometro.medir(f'tratamento.{etapa.__name__}'):
+                    base = etapa(base)
+            linhas_tratadas += len(base)
+            with cronometro.medir('detalhamento.gravar'):
+                gravar_detalhe(base, pasta / 'detalhe', caminho.stem, parte)
+            parte += 1
+            with cronometro.medir('agregacao.agregar_mes'):
+                contagens.append(agregar_base(base, observed=True))
+                if len(contagens) > 1:
+                    contagens = [somar_contagens(contagens)]
+            del base
+        particoes.extend(contagens)
+
+    with cronometro.medir('agregacao.juntar_particoes'):
+        base_tratada = juntar_particoes(particoes)
+
+    caminho_csv = pasta / 'base_final.csv'
+    with cronometro.medir('exportacao.csv'):
+        base_tratada.to_csv(caminho_csv, index=False)
+    with cronometro.medir('exportacao.compacta'):
+        salvar_base_compacta(base_tratada, pasta / 'base_final')
+    return caminho_csv, {'linhas_tratadas': linhas_tratadas, 'grupos_base_tratada': len(base_tratada)}
+
+
+def verificar_ingestao(pasta, semente=0, linhas=2_000):
+    """Confere que as leituras da ingestão chegam ao tratamento com os mesmos valores do Excel.
+
+    Parte das UFs vira o número 81 e parte dos municípios só o código, como células numéricas
+    do Excel, então essas colunas ficam mistas como as de datas. As linhas tratadas a partir do
+    Excel, da cópia colunar e dos lotes (pela planilha e pela cópia) têm de ser iguais às do notebook.
+    """
+    rng = np.random.default_rng(semente)
+    base = gerar_base_mensal(linhas, meses_sinteticos(1)[0], semente)
+    base.loc[rng.random(linhas) < 0.05, 'UF'] = 81
+    codigos = rng.random(linhas) < 0.05
+    base.loc[codigos, 'Mun Resid'] = base.loc[codigos, 'Mun Resid'].str.split('-').str[0].astype(int)
+    caminho_excel = pasta / 'verificacao.xlsx'
+    base.to_excel(caminho_excel, index=False)
+
+    esperado = tratar_base(pd.read_excel(caminho_excel).reindex(columns=colunas_desejadas)).reset_index(drop=True)
+    tratar_lotes = lambda: pd.concat([tratar_base(lote) for lote in ler_lotes(caminho_excel, linhas // 3, separar_mistas=True)], ignore_index=True)
+    # A primeira leitura de cada tipo vem da planilha e grava a cópia colunar; a seguinte, da cópia
+    leituras = {'lotes_planilha': tratar_lotes()}
+    leituras['excel'] = tratar_base(ler_arquivo_excel(caminho_excel, separar_mistas=True)).reset_index(drop=True)
+    leituras['copia_colunar'] = tratar_base(ler_arquivo_excel(caminho_excel, separar_mistas=True)).reset_index(drop=True)
+    leituras['lotes_copia'] = tratar_lotes()
+    for nome, tratada in leituras.items():
+        try:
+            pd.testing.assert_frame_equal(tratada, esperado)
+        except AssertionError as erro:
+            raise AssertionError(f"Leitura '{nome}' diferente da base do Excel: {erro}") from None
+
+
+def medir_dashboard(cronometro, caminho_csv):
+    """Carga da base final, montagem do cubo e cada cálculo da página para cada estado de filtro.
+
+    As consultas da base de detalhamento são medidas no pyarrow e, se instalado, no duckdb.
+    """
+    with cronometro.medir('dashboard.ler_base_final'):
+        base_final = ler_base_final(caminho_csv)
+    with cronometro.medir('dashboard.ler_base_compacta'):
+        ler_base_compacta(caminho_csv.with_suffix(''))
+    with cronometro.medir('dashboard.gerar_cubo'):
+        cubo = gerar_cubo(base_final)
+    with cronometro.medir('dashboard.indexar_cubo'):
+        motor = indexar_cubo(cubo)
+
+    for nome_estado, filtros in estados_filtro(motor).items():
+        for dimensao in [dimensao_total] + dimensoes_graficos:
+            with cronometro.medir(f'dashboard.{nome_estado}.filtrar.{dimensao}'):
+                fatiar_cubo(motor, dimensao, *filtros)
+        with cronometro.medir(f'dashboard.{nome_estado}.kpis'):
+            kpis = graficos.calcular_kpis(motor, filtros)
+            if kpis is not None:
+                graficos.figuras_kpis(kpis)
+        for nome_figura, construir in figuras_dashboard.items():
+            with cronometro.medir(f'dashboard.{nome_estado}.{nome_figura}'):
+                construir(motor, filtros)
+        for motor_consulta in sorted({'pyarrow', motor_padrao()}):
+            for nivel in niveis_detalhe:
+                with cronometro.medir(f'detalhamento.{motor_consulta}.{nome_estado}.{nivel.lower()}'):
+                    consultar_detalhe(caminho_csv.parent / 'detalhe', nivel, filtros[0], filtros[1], {'REGIAO_PAIS': filtros[2], 'CID_TIPO': filtros[3]}, motor=motor_consulta)
+
+
+def commit_atual():
+    try:
+        saida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent)
+        return saida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(linhas, meses=12, semente=0, repeticoes=1, excel=False, tamanho_lote=None):
+    """Executa a suíte e devolve o relatório (metadados e tempos de cada etapa em segundos)."""
+    amostras = defaultdict(list)
+    contagens = {}
+    for _ in range(repeticoes):
+        cronometro = Cronometro()
+        with tempfile.TemporaryDirectory(prefix='benchmark_inss_') as pasta:
+            verificar_ingestao(Path(pasta), semente)
+            caminho_csv, contagens = medir_pipeline(cronometro, linhas, meses, semente, Path(pasta), excel, tamanho_lote)
+            medir_dashboard(cronometro, caminho_csv)
+        for etapa, segundos in cronometro.tempos.items():
+            amostras[etapa].append(segundos)
+
+    return {
+        'metadados': {
+            'commit': commit_atual(),
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'linhas': linhas,
+            'meses': meses,
+            'semente': semente,
+            'repeticoes': repeticoes,
+            'tamanho_lote': tamanho_lote,
+            # Pico de memória residente do processo (ru_maxrss é em KiB no Linux)
+            'memoria_maxima_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+            **contagens,
+        },
+        # O mínimo das repetições é o valor comparado entre commits (menos sensível a ruído)
+        'etapas': {etapa: {'segundos': min(valores), 'mediana': statistics.median(valores), 'amostras': valores} for etapa, valores in amostras.items()},
+    }
+
+
+def comparar(relatorio, anterior, tolerancia):
+    """Imprime a razão atual/anterior de cada etapa e devolve as etapas mais lentas que a tolerância."""
+    regressoes = []
+    print(f"{'etapa':<45} {'anterior':>10} {'atual':>10} {'razão':>7}")
+    for etapa, tempos in relatorio['etapas'].items():
+        if etapa not in anterior['etapas']:
+            continue
+        antes, agora = anterior['etapas'][etapa]['segundos'], tempos['segundos']
+        razao = agora / antes if antes > 0 else float('inf')
+        marca = ' *' if razao > tolerancia else ''
+        print(f"{etapa:<45} {antes:>10.4f} {agora:>10.4f} {razao:>7.2f}{marca}")
+        if razao > tolerancia:
+            regressoes.append(etapa)
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mede o tempo de cada etapa do pipeline e do dashboard sobre dados sintéticos.")
+    parser.add_argument('--linhas', type=int, default=100_000, help="Total de linhas geradas (ex.: 100000 a 50000000).")
+    parser.add_argument('--meses', type=int, default=12, help="Quantidade de meses gerados.")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--lote', type=int, default=None, help="Processa cada mês em lotes com esta quantidade de linhas.")
+    parser.add_argument('--excel', action='store_true', help="Também mede a leitura dos arquivos em Excel (lento).")
+    parser.add_argument('--saida', default=None, help="Caminho do relatório JSON (padrão: output/benchmark/<commit>_<linhas>.json).")
+    parser.add_argument('--comparar', default=None, help="Relatório anterior para comparar com esta execução.")
+    parser.add_argument('--tolerancia', type=float, default=1.2, help="Razão atual/anterior acima da qual a etapa é uma regressão.")
+    args = parser.parse_args()
+
+    relatorio = executar(args.linhas, args.meses, args.semente, args.repeticoes, args.excel, args.lote)
+
+    saida = Path(args.saida or f"output/benchmark/{relatorio['metadados']['commit'] or 'sem_commit'}_{args.linhas}.json")
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=1)
+    print(f"Relatório salvo em: {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(relatorio, json.load(arquivo), args.tolerancia)
+        if regressoes:
+            print(f"Etapas acima da tolerância ({args.tolerancia}): {', '.join(regressoes)}")
+            sys.exit(1)
+    else:
+        for etapa, tempos in relatorio['etapas'].items():
+            print(f"{etapa:<45} {tempos['segundos']:>10.4f}s")
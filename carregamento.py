@@ -0,0 +1,97 @@
+import hashlib
+import inspect
+import json
+import os
+import types
+from pathlib import Path
+
+import pandas as pd
+
+# Colunas de texto repetitivo que passam a ser categóricas (menos memória e filtros mais rápidos)
+COLUNAS_CATEGORICAS = ['REGIAO_PAIS', 'CID_TIPO', 'SEXO', 'BENEF_TIPO', 'STATUS_BENEFICIARIO', 'IDADE_FAIXA']
+
+pasta_projeto = Path(__file__).resolve().parent
+# Globais que entram na chave das etapas (ex.: data_zerada é um Timestamp)
+tipos_parametro = (str, int, float, bool, list, tuple, dict, set, frozenset, pd.Timestamp, pd.Timedelta, pd.Period)
+
+
+def assinatura_arquivo(caminho):
+    """Retorna (mtime em ns, tamanho) do arquivo, sem ler o conteúdo."""
+    info = os.stat(caminho)
+    return info.st_mtime_ns, info.st_size
+
+
+def hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    """Calcula o SHA-256 do conteúdo do arquivo, lendo em blocos."""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _nomes_globais(codigo):
+    # Nomes globais usados pela função, incluindo os de lambdas e funções internas
+    nomes = set(codigo.co_names)
+    for constante in codigo.co_consts:
+        if isinstance(constante, types.CodeType):
+            nomes |= _nomes_globais(constante)
+    return nomes
+
+
+def _eh_do_projeto(funcao):
+    try:
+        return Path(inspect.getsourcefile(funcao)).resolve().parent == pasta_projeto
+    except TypeError:
+        return False
+
+
+def assinatura_codigo(funcao, vistos=None):
+    """Código da função e, recursivamente, das funções e dos parâmetros globais do projeto que ela usa.
+
+    Assim a chave de uma etapa (ou da partição de um mês, em ingestao.py) muda quando muda o seu código ou um parâmetro como bins_idade
+    ou mapa_cid_letra, mas não quando muda o de outra etapa.
+    """
+    vistos = set() if vistos is None else vistos
+    if funcao in vistos:
+        return {}
+    vistos.add(funcao)
+    partes = {f'{funcao.__module__}.{funcao.__qualname__}': inspect.getsource(funcao)}
+    for nome in sorted(_nomes_globais(funcao.__code__)):
+        if nome not in funcao.__globals__:
+            continue
+        valor = funcao.__globals__[nome]
+        if isinstance(valor, types.FunctionType) and _eh_do_projeto(valor):
+            partes.update(assinatura_codigo(valor, vistos))
+        elif isinstance(valor, (list, tuple)) and valor and all(isinstance(item, types.FunctionType) for item in valor):
+            # Listas de etapas (ex.: etapas_tratamento) entram pela ordem e pelo código de cada função
+            partes[f'{funcao.__module__}.{nome}'] = [f'{item.__module__}.{item.__qualname__}' for item in valor]
+            for item in valor:
+                if _eh_do_projeto(item):
+                    partes.update(assinatura_codigo(item, vistos))
+        elif isinstance(valor, tipos_parametro):
+            partes[f'{funcao.__module__}.{nome}'] = json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str)
+    return partes
+
+
+def calcular_chave(*partes):
+    sha = hashlib.sha256()
+    for parte in partes:
+        sha.update(json.dumps(parte, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def ler_base_final(caminho):
+    """Lê a base final já com os tipos que o dashboard utiliza."""
+    base = pd.read_csv(caminho, dtype={coluna: 'category' for coluna in COLUNAS_CATEGORICAS})
+
+    if 'MES' in base.columns:
+        base['MES'] = pd.to_datetime(base['MES'])
+        base['MES_STR'] = base['MES'].dt.strftime('%Y-%m').astype('category')
+
+    if 'QTD_BENEFICIOS' in base.columns:
+        base['QTD_BENEFICIOS'] = pd.to_numeric(base['QTD_BENEFICIOS'], errors='coerce').fillna(0)
+    if 'POPULACAO' in base.columns:
+        base['POPULACAO'] = pd.to_numeric(base['POPULACAO'], errors='coerce').fillna(0)
+
+    return base
@@ -0,0 +1,88 @@
+import pandas as pd
+
+from filtros import MotorFiltros
+
+# Dimensões dos filtros da barra lateral e dimensões exibidas nos gráficos do dashboard
+dimensoes_filtro = ['MES', 'REGIAO_PAIS', 'CID_TIPO']
+dimensoes_graficos = ['BENEF_TIPO', 'STATUS_BENEFICIARIO', 'IDADE_FAIXA', 'SEXO']
+
+# Fatia do cubo com os totais por mês x região x CID (sem dimensão de gráfico)
+dimensao_total = 'TOTAL'
+
+
+def gerar_cubo(base_tratada):
+    """Pré-agrega a base final: totais por mês x região x CID, cruzados com cada dimensão dos gráficos.
+
+    O cubo fica no formato longo (DIMENSAO, VALOR, MES, REGIAO_PAIS, CID_TIPO, QTD_BENEFICIOS),
+    com a população da região repetida em POPULACAO.
+    """
+    dimensoes = [None] + [dimensao for dimensao in dimensoes_graficos if dimensao in base_tratada.columns]
+    partes = []
+    for dimensao in dimensoes:
+        chaves = dimensoes_filtro + ([dimensao] if dimensao else [])
+        parte = base_tratada.groupby(chaves, observed=True)['QTD_BENEFICIOS'].sum().reset_index()
+        parte['DIMENSAO'] = dimensao or dimensao_total
+        parte['VALOR'] = parte.pop(dimensao).astype(str) if dimensao else None
+        partes.append(parte)
+
+    cubo = pd.concat(partes, ignore_index=True)
+    cubo['MES'] = pd.to_datetime(cubo['MES'])
+    for coluna in ['DIMENSAO', 'VALOR', 'REGIAO_PAIS', 'CID_TIPO']:
+        cubo[coluna] = cubo[coluna].astype('category')
+
+    if 'POPULACAO' in base_tratada.columns:
+        populacao = pd.to_numeric(base_tratada.groupby('REGIAO_PAIS', observed=True)['POPULACAO'].first(), errors='coerce').fillna(0)
+        cubo['POPULACAO'] = cubo['REGIAO_PAIS'].map(populacao).astype('float64')
+
+    return cubo[['DIMENSAO', 'VALOR'] + dimensoes_filtro + ['QTD_BENEFICIOS'] + (['POPULACAO'] if 'POPULACAO' in cubo.columns else [])]
+
+
+def salvar_cubo(cubo, caminho):
+    cubo.to_parquet(caminho, index=False)
+
+
+def ler_cubo(caminho):
+    return pd.read_parquet(caminho)
+
+
+def dimensoes_disponiveis(cubo):
+    return set(dimensoes_filtro) | set(cubo['DIMENSAO'].unique())
+
+
+# Colunas materializadas em cada fatia: os totais alimentam KPIs e gráficos por região, as demais só os gráficos
+colunas_fatia_total = ['MES', 'REGIAO_PAIS', 'QTD_BENEFICIOS', 'POPULACAO']
+colunas_fatia_grafico = ['VALOR', 'MES', 'QTD_BENEFICIOS']
+
+
+def indexar_cubo(cubo):
+    """Cria o motor de filtros do cubo, particionado pela DIMENSAO."""
+    return MotorFiltros(cubo)
+
+
+def fatiar_cubo(motor, dimensao, periodo_inicio, periodo_fim, regioes, cids):
+    """Linhas do cubo de uma dimensão dentro do período e das regiões/CIDs selecionados.
+
+    Assim como no dashboard, uma lista vazia de regiões ou de CIDs não filtra.
+    """
+    selecoes = {'REGIAO_PAIS': regioes, 'CID_TIPO': cids}
+    if dimensao in dimensoes_graficos:
+        return motor.filtrar(dimensao, periodo_inicio, periodo_fim, selecoes, colunas_fatia_grafico)
+    return motor.filtrar(dimensao_total, periodo_inicio, periodo_fim, selecoes, colunas_fatia_total)
+
+
+def somar_por(fatia, dimensao, *outras):
+    """Soma QTD_BENEFICIOS da fatia pela dimensão (e colunas extras, como MES)."""
+    fatia = fatia.rename(columns={'VALOR': dimensao}) if dimensao in dimensoes_graficos else fatia
+    chaves = [dimensao, *outras]
+    agregado = fatia.groupby(chaves, observed=True)['QTD_BENEFICIOS'].sum().reset_index()
+    if dimensao in dimensoes_graficos:
+        agregado[dimensao] = agregado[dimensao].astype(str)
+    return agregado
+
+
+def populacao_por_regiao(cubo, regioes=None):
+    """População de cada região presente no cubo (ou nas regiões informadas)."""
+    fatia = cubo[cubo['DIMENSAO'] == dimensao_total]
+    if regioes:
+        fatia = fatia[fatia['REGIAO_PAIS'].isin(regioes)]
+    return fatia.groupby('REGIAO_PAIS', observed=True)['POPULACAO'].first()
@@ -0,0 +1,134 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from tratamento import colunas_desejadas
+
+# Valores possíveis de cada coluna categórica, no formato das bases mensais do INSS
+especies = {
+    31: 'Auxílio Doença Previdenciário',
+    91: 'Auxílio Doença por Acidente do Trabalho',
+    32: 'Aposentadoria por Invalidez Previdenciária',
+    92: 'Aposentadoria por Invalidez por Acidente do Trabalho',
+    36: 'Auxílio Acidente Previdenciário',
+    94: 'Auxílio Acidente por Acidente do Trabalho',
+}
+cids = [
+    'F32 Episódios depressivos', 'F41 Outros transtornos ansiosos', 'M54 Dorsalgia', 'M51 Outros transtornos de discos intervertebrais',
+    'I10 Hipertensão essencial', 'I21 Infarto agudo do miocárdio', 'A15 Tuberculose respiratória', 'B20 Doença pelo HIV',
+    'C50 Neoplasia maligna da mama', 'D25 Leiomioma do útero', 'E11 Diabetes mellitus não-insulino-dependente', 'G40 Epilepsia',
+    'S82 Fratura da perna', 'T14 Traumatismo de região não especificada', 'O20 Hemorragia do início da gravidez', 'K40 Hérnia inguinal',
+    'Zerados', '{ñ class}', 'Em Branco',
+]
+despachos = ['Concessão Normal', 'Concessão com Base em Decisão Judicial', 'Concessão Revista']
+sexos = ['Masculino', 'Feminino']
+clientelas = ['Urbano', 'Rural']
+municipios = ['355030-São Paulo', '330455-Rio de Janeiro', '310620-Belo Horizonte', '292740-Salvador', '230440-Fortaleza', '530010-Brasília', '130260-Manaus', '431490-Porto Alegre']
+vinculos = ['Não se aplica', 'Cônjuge', 'Filho']
+filiacoes = ['Empregado', 'Empregado Doméstico', 'Contribuinte Individual', 'Desempregado', 'Segurado Especial', 'Facultativo', 'Empresário', 'Equiparado a Autônomo', 'Trabalhador Avulso']
+ramos = ['Comerciário', 'Industriário', 'Rural', 'Transportes e Carga', 'Servidor Público']
+paises = ['Brasil', 'Portugal']
+classificadores_pa = ['Não', 'Sim']
+# Estados aparecem por sigla ou por nome (como nas bases reais), e '81' é o código inválido descartado no tratamento
+ufs = ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO', 'AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE', 'GO', 'MT', 'MS', 'DF',
+       'ES', 'MG', 'RJ', 'SP', 'PR', 'RS', 'SC', 'São Paulo', 'Minas Gerais', 'Bahia', 'Rio Grande do Sul', '81']
+
+# Proporção de linhas com a data zerada ('00/00/0000') em cada coluna
+proporcao_zerados = {'Dt DCB': 0.08, 'Dt DDB': 0.03}
+
+
+def _datas_com_zerados(datas, rng, proporcao):
+    # Coluna mista, como lida do Excel: datetime nas linhas preenchidas e o texto '00/00/0000' nas zeradas
+    coluna = datas.astype('datetime64[us]').astype(object)
+    coluna[rng.random(len(coluna)) < proporcao] = '00/00/0000'
+    return pd.Series(coluna, dtype=object)
+
+
+def _sortear(rng, valores, linhas, p=None):
+    # Sorteia posições e indexa um vetor de objetos, evitando converter textos numpy em objetos linha a linha
+    return np.array(valores, dtype=object)[rng.choice(len(valores), linhas, p=p)]
+
+
+def gerar_base_mensal(linhas, mes, semente=0):
+    """Gera uma base mensal sintética com as colunas_desejadas, como lida de um arquivo Excel."""
+    rng = np.random.default_rng(semente)
+    competencia = pd.Timestamp(mes).to_period('M').to_timestamp()
+    um_dia = np.timedelta64(1, 'D')
+
+    dib = competencia.to_datetime64() - rng.integers(0, 90, linhas) * um_dia
+    nascimento = dib - rng.integers(16 * 365, 85 * 365, linhas) * um_dia
+    ddb = dib + rng.integers(0, 240, linhas) * um_dia
+    dcb = dib + rng.integers(1, 900, linhas) * um_dia
+
+    codigos_especie = rng.choice(list(especies), linhas)
+    base = pd.DataFrame({
+        "Competência concessão": np.full(linhas, competencia.to_datetime64()),
+        "Espécie_NUM": codigos_especie,
+        "Espécie_NOME": pd.Series(codigos_especie).map(especies).to_numpy(dtype=object),
+        "CID_NUM_NOME": _sortear(rng, cids, linhas),
+        "Despacho_NOME": _sortear(rng, despachos, linhas),
+        "Dt Nascimento": nascimento,
+        "Sexo.": _sortear(rng, sexos, linhas),
+        "Clientela": _sortear(rng, clientelas, linhas, p=[0.8, 0.2]),
+        "Mun Resid": _sortear(rng, municipios, linhas),
+        "Vínculo dependentes": _sortear(rng, vinculos, linhas, p=[0.9, 0.05, 0.05]),
+        "Forma Filiação": _sortear(rng, filiacoes, linhas),
+        "UF": _sortear(rng, ufs, linhas),
+        "Qt SM RMI": np.round(rng.gamma(2.0, 1.5, linhas), 2),
+        "Ramo Atividade": _sortear(rng, ramos, linhas),
+        "Dt DCB": _datas_com_zerados(dcb, rng, proporcao_zerados['Dt DCB']),
+        "Dt DDB": _datas_com_zerados(ddb, rng, proporcao_zerados['Dt DDB']),
+        "Dt DIB": dib,
+        "País de Acordo Internacional": _sortear(rng, paises, linhas, p=[0.99, 0.01]),
+        "Classificador PA": _sortear(rng, classificadores_pa, linhas, p=[0.97, 0.03]),
+    })
+    return base[colunas_desejadas]
+
+
+def meses_sinteticos(quantidade, ultimo_mes='2024-12'):
+    fim = pd.Period(ultimo_mes, 'M')
+    return [(fim - i).to_timestamp() for i in reversed(range(quantidade))]
+
+
+def gerar_bases(linhas_total, meses=12, semente=0):
+    """Gera as bases mensais, uma por vez, dividindo linhas_total entre os meses.
+
+    Cada mês usa uma semente derivada da semente informada, então o resultado é reprodutível
+    e só uma base mensal fica em memória de cada vez.
+    """
+    lista_meses = meses_sinteticos(meses)
+    linhas_por_mes = np.full(meses, linhas_total // meses)
+    linhas_por_mes[:linhas_total % meses] += 1
+    for i, (mes, linhas) in enumerate(zip(lista_meses, linhas_por_mes)):
+        yield mes, gerar_base_mensal(int(linhas), mes, semente * 1000 + i)
+
+
+def nome_arquivo_mes(mes, extensao):
+    # Mesmo padrão dos arquivos do INSS (ex.: ben_ago_24.xlsx)
+    nomes = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+    return f"ben_{nomes[mes.month - 1]}_{mes.year % 100:02d}{extensao}"
+
+
+if __name__ == '__main__':
+    from ingestao import gravar_base_bruta
+
+    parser = argparse.ArgumentParser(description="Gera bases mensais sintéticas no formato das bases do INSS.")
+    parser.add_argument('--linhas', type=int, default=100_000, help="Total de linhas, divididas entre os meses.")
+    parser.add_argument('--meses', type=int, default=12, help="Quantidade de meses gerados.")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', default='bases_sinteticas', help="Pasta dos arquivos gerados.")
+    parser.add_argument('--excel', action='store_true', help="Grava em Excel (lento) em vez de parquet.")
+    args = parser.parse_args()
+
+    pasta = Path(args.saida)
+    pasta.mkdir(parents=True, exist_ok=True)
+    for mes, base in gerar_bases(args.linhas, args.meses, args.semente):
+        if args.excel:
+            caminho = pasta / nome_arquivo_mes(mes, '.xlsx')
+            base.to_excel(caminho, index=False)
+        else:
+            caminho = pasta / nome_arquivo_mes(mes, '.parquet')
+            gravar_base_bruta(base, caminho)
+        print(f"Gerado o arquivo: {caminho.name} ({len(base)} linhas)")
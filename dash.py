@@ -1,9 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
 import locale
+import os
+
+from armazenamento import caminho_fatos, existe_base_compacta, ler_base_compacta
+from carregamento import assinatura_arquivo, hash_arquivo, ler_base_final
+from cubo import dimensao_total, dimensoes_disponiveis, gerar_cubo, indexar_cubo, ler_cubo
+from detalhamento import assinatura_detalhe, consultar_detalhe, existe_detalhe, niveis_detalhe, rotulos_medidas
+from graficos import (CacheFiguras, calcular_kpis, figura_detalhamento, figura_faixa_etaria, figura_pareto_status, figura_rosca_regiao, figura_taxa_mes_sexo,
+                      figura_taxa_regiao, figura_tipo_beneficio, figuras_kpis, normalizar_filtros)
+from instrumentacao import Instrumentacao, ligada
+
+# Copy-on-write: a base em cache é compartilhada entre as sessões e nunca é alterada pelos filtros
+pd.options.mode.copy_on_write = True
 
 try:
     # Tentando definir o locale para pt_BR com codificação UTF-8
@@ -15,11 +24,11 @@ except locale.Error:
         pass
 
 
-# Definição da paleta de cores para os gráficos
-minha_paleta_de_cores_graficos = ['#8A3FFC', '#FF8C00', '#A076F9', '#FFB74D', '#D946EF', '#FF7043']
-
 st.set_page_config(layout="wide")
 
+# Tempo e memória por etapa, ligados por ?instrumentacao=1 ou INSS_INSTRUMENTACAO=1 (desligados, não custam nada)
+instrumentacao = Instrumentacao(ativa=ligada(st.query_params))
+
 # Incluindo o CSS customizado
 custom_css = """
 <style>
@@ -68,20 +77,60 @@ st.markdown(custom_css, unsafe_allow_html=True)
 st.title("Benefícios concedidos do INSS")
 
 caminho_base = "output/base_final.csv"
+caminho_base_compacta = "output/base_final" # Tabela de fatos e dimensões exportadas junto com a base final
+caminho_cubo = "output/cubo.parquet" # Cubo pré-agregado exportado junto com a base final
+caminho_detalhe = "output/detalhe" # Linhas tratadas por mês (opcional, gravadas por python ingestao.py --detalhe)
+
+# O hash só é recalculado quando o mtime/tamanho do arquivo muda
+@st.cache_data(show_spinner=False)
+def obter_hash_arquivo(caminho, assinatura):
+    return hash_arquivo(caminho)
+
+# Uma única cópia do cubo (já indexada para os filtros) por processo, compartilhada por todas as sessões e recarregada só se o conteúdo mudar
+@st.cache_resource(show_spinner="Carregando a base...", max_entries=1)
+def carregar_cubo(caminho, hash_conteudo):
+    return indexar_cubo(ler_cubo(caminho))
+
+# Sem o cubo exportado, ele é gerado uma única vez a partir da base final (compacta, se existir, ou CSV)
+@st.cache_resource(show_spinner="Carregando a base...", max_entries=1)
+def carregar_cubo_da_base(caminho, hash_conteudo):
+    base_inss = ler_base_compacta(caminho) if os.path.isdir(caminho) else ler_base_final(caminho)
+    if 'MES' not in base_inss.columns:
+        return None
+    return indexar_cubo(gerar_cubo(base_inss))
+
+# A imagem da barra lateral é lida do disco uma única vez
+@st.cache_resource(show_spinner=False)
+def ler_imagem(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+# Figuras já construídas, por estado dos filtros; um novo cache é criado quando os dados mudam
+@st.cache_resource(max_entries=1)
+def obter_cache_figuras(hash_conteudo):
+    return CacheFiguras(tamanho_maximo=256)
 
 try:
-    base_inss = pd.read_csv(caminho_base)
-    if 'MES' in base_inss.columns:
-        base_inss['MES'] = pd.to_datetime(base_inss['MES'])
-        base_inss['MES_STR'] = base_inss['MES'].dt.strftime('%Y-%m')
+    if os.path.exists(caminho_cubo):
+        with instrumentacao.medir('carga.hash'):
+            hash_dados = obter_hash_arquivo(caminho_cubo, assinatura_arquivo(caminho_cubo))
+        with instrumentacao.medir('carga.cubo'):
+            motor_cubo = carregar_cubo(caminho_cubo, hash_dados)
+    elif existe_base_compacta(caminho_base_compacta):
+        with instrumentacao.medir('carga.hash'):
+            hash_dados = obter_hash_arquivo(caminho_fatos(caminho_base_compacta), assinatura_arquivo(caminho_fatos(caminho_base_compacta)))
+        with instrumentacao.medir('carga.cubo'):
+            motor_cubo = carregar_cubo_da_base(caminho_base_compacta, hash_dados)
     else:
+        with instrumentacao.medir('carga.hash'):
+            hash_dados = obter_hash_arquivo(caminho_base, assinatura_arquivo(caminho_base))
+        with instrumentacao.medir('carga.cubo'):
+            motor_cubo = carregar_cubo_da_base(caminho_base, hash_dados)
+    if motor_cubo is None:
         st.error("Coluna 'MES' não encontrada no arquivo. Esta coluna é essencial.")
         st.stop()
-
-    if 'QTD_BENEFICIOS' in base_inss.columns:
-        base_inss['QTD_BENEFICIOS'] = pd.to_numeric(base_inss['QTD_BENEFICIOS'], errors='coerce').fillna(0)
-    if 'POPULACAO' in base_inss.columns:
-        base_inss['POPULACAO'] = pd.to_numeric(base_inss['POPULACAO'], errors='coerce').fillna(0)
+    cubo = motor_cubo.base
+    cache_figuras = obter_cache_figuras(hash_dados)
 
 except FileNotFoundError:
     st.error(f"Arquivo não encontrado em: {caminho_base}")
@@ -92,233 +141,111 @@ except Exception as e:
 
 st.sidebar.header("Filtros")
 
+# Totais por mês x região x CID: base para os filtros, os KPIs e os gráficos por região
+base_inss = motor_cubo.particao(dimensao_total)
+dimensoes_cubo = dimensoes_disponiveis(cubo)
+
 min_data_disponivel = base_inss['MES'].min().date()
 max_data_disponivel = base_inss['MES'].max().date()
 
 st.sidebar.markdown("#### Selecione o Período (jun/24 a mar/25):")
-data_inicio_selecionada = st.sidebar.date_input(
-    "Início:",
-    value=min_data_disponivel,
-    min_value=min_data_disponivel,
-    max_value=max_data_disponivel,
-    key="data_inicio",
-    help="O filtro considera o mês inteiro. Selecione o 1º dia do mês desejado."
-)
-data_fim_selecionada = st.sidebar.date_input(
-    "Fim:",
-    value=max_data_disponivel,
-    min_value=min_data_disponivel,
-    max_value=max_data_disponivel,
-    key="data_fim",
-    help="O filtro considera o mês inteiro. Selecione o 1º dia do mês desejado."
-)
+with instrumentacao.medir('filtro.data_inicio'):
+    data_inicio_selecionada = st.sidebar.date_input(
+        "Início:",
+        value=min_data_disponivel,
+        min_value=min_data_disponivel,
+        max_value=max_data_disponivel,
+        key="data_inicio",
+        help="O filtro considera o mês inteiro. Selecione o 1º dia do mês desejado."
+    )
+with instrumentacao.medir('filtro.data_fim'):
+    data_fim_selecionada = st.sidebar.date_input(
+        "Fim:",
+        value=max_data_disponivel,
+        min_value=min_data_disponivel,
+        max_value=max_data_disponivel,
+        key="data_fim",
+        help="O filtro considera o mês inteiro. Selecione o 1º dia do mês desejado."
+    )
 
 if data_inicio_selecionada > data_fim_selecionada:
     st.sidebar.error("A data de início não pode ser posterior à data de fim.")
     st.stop()
 
-if 'REGIAO_PAIS' in base_inss.columns and not base_inss.empty:
-    regioes = sorted(base_inss["REGIAO_PAIS"].dropna().unique())
-    regioes_selecionadas = st.sidebar.multiselect("Região:", regioes, default=regioes)
-else:
-    regioes_selecionadas = []
+with instrumentacao.medir('filtro.regiao'):
+    if 'REGIAO_PAIS' in base_inss.columns and not base_inss.empty:
+        regioes = sorted(base_inss["REGIAO_PAIS"].dropna().unique())
+        regioes_selecionadas = st.sidebar.multiselect("Região:", regioes, default=regioes)
+    else:
+        regioes = regioes_selecionadas = []
 
-if 'CID_TIPO' in base_inss.columns and not base_inss.empty:
-    cids = sorted(base_inss["CID_TIPO"].dropna().unique())
-    cids_selecionados = st.sidebar.multiselect("Categoria do CID:", cids, default=cids)
-else:
-    cids_selecionados = []
+with instrumentacao.medir('filtro.cid'):
+    if 'CID_TIPO' in base_inss.columns and not base_inss.empty:
+        cids = sorted(base_inss["CID_TIPO"].dropna().unique())
+        cids_selecionados = st.sidebar.multiselect("Categoria do CID:", cids, default=cids)
+    else:
+        cids = cids_selecionados = []
 
 try:
-    st.sidebar.image("imagens/beckz.png", use_container_width='stretch')
+    st.sidebar.image(ler_imagem("imagens/beckz.png"), use_container_width='stretch')
 except FileNotFoundError:
     st.sidebar.warning("Arquivo da imagem 'imagens/beckz.png' não encontrado.")
 except Exception as e:
     st.sidebar.error(f"Erro ao carregar a imagem: {e}")
 
-base_inss_filtrada = base_inss.copy()
-
-if 'REGIAO_PAIS' in base_inss_filtrada.columns and regioes_selecionadas:
-    base_inss_filtrada = base_inss_filtrada[base_inss_filtrada["REGIAO_PAIS"].isin(regioes_selecionadas)]
-
-periodo_inicio_filtro = pd.to_datetime(data_inicio_selecionada).to_period('M')
-periodo_fim_filtro = pd.to_datetime(data_fim_selecionada).to_period('M')
-base_inss_filtrada = base_inss_filtrada[
-    base_inss_filtrada['MES'].dt.to_period('M').between(periodo_inicio_filtro, periodo_fim_filtro, inclusive='both')
-]
-
-if 'CID_TIPO' in base_inss_filtrada.columns and cids_selecionados:
-    base_inss_filtrada = base_inss_filtrada[base_inss_filtrada["CID_TIPO"].isin(cids_selecionados)]
-
-if base_inss_filtrada.empty:
-    st.warning("Nenhum dado corresponde aos filtros selecionados.")
-else:
-    # BIG NUMBERS
-    st.subheader("Indicadores Chave do Período Filtrado")
-
-    total_beneficios_kpi = base_inss_filtrada['QTD_BENEFICIOS'].sum()
-
-    if 'REGIAO_PAIS' in base_inss_filtrada.columns and 'POPULACAO' in base_inss_filtrada.columns:
-        populacao_df_sum = base_inss_filtrada.groupby('REGIAO_PAIS')['POPULACAO'].first()
-        populacao_coberta_kpi = populacao_df_sum.sum() if not populacao_df_sum.empty else 0
-    else:
-        populacao_coberta_kpi = 0
-
-    if pd.isna(populacao_coberta_kpi):
-        populacao_coberta_kpi = 0
-
-    taxa_geral_kpi = (total_beneficios_kpi / populacao_coberta_kpi) * 100000 if populacao_coberta_kpi > 0 else 0
-    meses_cobertos_kpi = base_inss_filtrada['MES_STR'].nunique() if 'MES_STR' in base_inss_filtrada.columns else 0
-
-    # Visual
-    #kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
-    #with kpi_col1:
-        #st.metric(label="Total de Benefícios", value=f"{total_beneficios_kpi:,.0f}")
-    #with kpi_col2:
-        #st.metric(label="População Coberta", value=f"{populacao_coberta_kpi:,.0f}" if populacao_coberta_kpi > 0 else "N/D")
-    #with kpi_col3:
-        #st.metric(label="Taxa Geral (por 100K hab.)", value=f"{taxa_geral_kpi:,.2f}" if taxa_geral_kpi > 0 else "N/D")
-    #with kpi_col4:
-        #st.metric(label="Meses no Filtro", value=meses_cobertos_kpi)
-
-    # Layout com 4 colunas
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        fig1 = go.Figure(go.Indicator(
-            mode="number",
-            value=total_beneficios_kpi,
-            title={"text": "Total de Benefícios"},
-            number={"valueformat": ","}
-        ))
-        # Configurando os separadores no layout da figura
-        fig1.update_layout(
-            height=180,
-            margin=dict(t=30, b=0, l=0, r=0),
-            separators=',.'
-        )
-        st.plotly_chart(fig1, use_container_width=True)
-
-    with col2:
-        fig2 = go.Figure(go.Indicator(
-            mode="number",
-            value=populacao_coberta_kpi,
-            title={"text": "População Coberta"},
-            number={"valueformat": ","}
-        ))
-        # Configurando os separadores no layout da figura
-        fig2.update_layout(
-            height=180,
-            margin=dict(t=30, b=0, l=0, r=0),
-            separators=',.'
-        )
-        st.plotly_chart(fig2, use_container_width=True)
-
-    with col3:
-        fig3 = go.Figure(go.Indicator(
-            mode="number",
-            value=round(taxa_geral_kpi, 2),
-            title={"text": "Taxa Geral (por 100k hab.)"},
-            number={"valueformat": ",.2f"}
-        ))
-        # Configurando os separadores no layout da figura
-        fig3.update_layout(
-            height=180,
-            margin=dict(t=30, b=0, l=0, r=0),
-            separators=',.' # ',' para decimal, '.' para milhar
-        )
-        st.plotly_chart(fig3, use_container_width=True)
-
-    with col4:
-        fig4 = go.Figure(go.Indicator(
-            mode="number",
-            value=meses_cobertos_kpi,
-            title={"text": "Meses no Filtro"},
-            # ",d" formata como inteiro e habilita agrupamento de milhares.
-            number={"valueformat": ",d"}
-        ))
-        # Configurando os separadores no layout da figura
-        fig4.update_layout(
-            height=180,
-            margin=dict(t=30, b=0, l=0, r=0),
-            separators=',.'
-        )
-        st.plotly_chart(fig4, use_container_width=True)
-
-    st.markdown("---")
-    
-    # Definição das colunas
-
+# Estado normalizado dos filtros: também é a chave das figuras no cache
+with instrumentacao.medir('filtro.normalizar'):
+    filtros_cubo = normalizar_filtros(data_inicio_selecionada, data_fim_selecionada, regioes_selecionadas, cids_selecionados, regioes, cids)
+
+def obter_figura(nome, construir, filtros):
+    with instrumentacao.medir(f'calculo.{nome}'):
+        return cache_figuras.obter((nome,) + filtros, lambda: construir(motor_cubo, filtros))
+
+# Exibição separada do cálculo: inclui a serialização da figura feita pelo st.plotly_chart
+def exibir_grafico(nome, fig):
+    with instrumentacao.medir(f'exibicao.{nome}'):
+        st.plotly_chart(fig, use_container_width=True)
+
+def painel_instrumentacao():
+    if not instrumentacao.ativa:
+        return
+    with st.expander("Instrumentação: tempo e memória por etapa", expanded=False):
+        st.dataframe(instrumentacao.tabela(), use_container_width=True, hide_index=True)
+        estatisticas = cache_figuras.estatisticas()
+        st.caption(f"Cache de figuras: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas, {estatisticas['itens']}/{estatisticas['tamanho_maximo']} itens. Log: {instrumentacao.caminho_log}")
+    instrumentacao.registrar_log()
+
+# Cada linha de gráficos depende apenas do estado dos filtros recebido
+def linha_regiao_tipo(filtros):
     col1_linha1, col2_linha1 = st.columns(2) # Gráfico de rosca dos benefícios por região / Gráfico de barras com o tipo do benefício
-    col1_linha2, col2_linha2 = st.columns(2) # Gráfico de pareto por status do beneficiário / Gráfico de barras com a distribuição por faixa etária
-    col1_linha3, col2_linha3 = st.columns(2) # Gráfico de barras com a taxa por região / Gráfico de barras com a taxa por mês e sexo
-    
-    altura_grafico = 450
-    plotly_separators_config = ',.' # Definindo o separador de milhar para os gráficos
 
-    # LINHA 1 DE GRÁFICOS
     with col1_linha1:
         st.subheader("Benefícios por Região (%)")
-        if 'REGIAO_PAIS' in base_inss_filtrada.columns and 'QTD_BENEFICIOS' in base_inss_filtrada.columns:
-            base_inss_regiao_qtd = base_inss_filtrada.groupby('REGIAO_PAIS')['QTD_BENEFICIOS'].sum().reset_index()
-            base_inss_regiao_qtd = base_inss_regiao_qtd[base_inss_regiao_qtd['QTD_BENEFICIOS'] > 0]
-            if not base_inss_regiao_qtd.empty and base_inss_regiao_qtd['QTD_BENEFICIOS'].sum() > 0 :
-                total_beneficios_rosca = base_inss_regiao_qtd['QTD_BENEFICIOS'].sum()
-                regiao_maior_valor_linha = base_inss_regiao_qtd.loc[base_inss_regiao_qtd['QTD_BENEFICIOS'].idxmax()]
-                nome_maior_regiao = regiao_maior_valor_linha['REGIAO_PAIS']
-                percentual_maior_regiao = (regiao_maior_valor_linha['QTD_BENEFICIOS'] / total_beneficios_rosca) * 100
-                fig_rosca = px.pie(base_inss_regiao_qtd, names='REGIAO_PAIS', values='QTD_BENEFICIOS', hole=0.5, color_discrete_sequence=minha_paleta_de_cores_graficos)
-                fig_rosca.update_layout(height=altura_grafico, annotations=[dict(text=f"<b>{nome_maior_regiao}</b><br>{(percentual_maior_regiao).round()}%", x=0.5, y=0.5, font_size=16, showarrow=False)], legend_title_text='Regiões', margin=dict(t=30, b=20, l=0, r=0), separators=plotly_separators_config)
-                fig_rosca.update_traces(textposition='outside', textinfo='percent+label') 
-                st.plotly_chart(fig_rosca, use_container_width=True)
-            else: st.warning("Dados insuficientes ou zerados para gráfico de rosca por Região.")
-        else: st.warning("Colunas 'REGIAO_PAIS' ou 'QTD_BENEFICIOS' não encontradas.")
+        fig_rosca = obter_figura('rosca_regiao', figura_rosca_regiao, filtros)
+        if fig_rosca is not None: exibir_grafico('rosca_regiao', fig_rosca)
+        else: st.warning("Dados insuficientes ou zerados para gráfico de rosca por Região.")
 
         st.markdown("---")
 
     with col2_linha1:
         st.subheader("Benefícios por Tipo")
-        if 'BENEF_TIPO' in base_inss_filtrada.columns and 'QTD_BENEFICIOS' in base_inss_filtrada.columns:
-            benef_tipo_agg = base_inss_filtrada.groupby('BENEF_TIPO')['QTD_BENEFICIOS'].sum().reset_index()
-            benef_tipo_agg = benef_tipo_agg[benef_tipo_agg['QTD_BENEFICIOS'] > 0]
-            benef_tipo_agg = benef_tipo_agg.sort_values(by='QTD_BENEFICIOS', ascending=False)
-            if not benef_tipo_agg.empty:
-                fig_bar_benef_tipo = px.bar(benef_tipo_agg, x='QTD_BENEFICIOS', y='BENEF_TIPO', orientation='h', labels={'QTD_BENEFICIOS': 'Qtd. Benefícios', 'BENEF_TIPO': 'Tipo de Benefício'}, text='QTD_BENEFICIOS', color='BENEF_TIPO', color_discrete_sequence=minha_paleta_de_cores_graficos)
-                fig_bar_benef_tipo.update_layout(height=altura_grafico, yaxis={'categoryorder':'total ascending'}, margin=dict(t=30, b=40, l=0, r=0), showlegend=False, separators=plotly_separators_config)
-                fig_bar_benef_tipo.update_traces(texttemplate='%{x:,.0f}', textposition='outside')
-                st.plotly_chart(fig_bar_benef_tipo, use_container_width=True)
+        if 'BENEF_TIPO' in dimensoes_cubo:
+            fig_bar_benef_tipo = obter_figura('tipo_beneficio', figura_tipo_beneficio, filtros)
+            if fig_bar_benef_tipo is not None: exibir_grafico('tipo_beneficio', fig_bar_benef_tipo)
             else: st.warning("Sem dados para gráfico de Benefícios por Tipo.")
         else: st.warning("Colunas 'BENEF_TIPO' ou 'QTD_BENEFICIOS' não encontradas.")
 
         st.markdown("---")
 
-    # LINHA 2 DE GRÁFICOS
+def linha_status_idade(filtros):
+    col1_linha2, col2_linha2 = st.columns(2) # Gráfico de pareto por status do beneficiário / Gráfico de barras com a distribuição por faixa etária
+
     with col1_linha2:
         st.subheader("Pareto por Status do Beneficiário")
-        if 'STATUS_BENEFICIARIO' in base_inss_filtrada.columns and 'QTD_BENEFICIOS' in base_inss_filtrada.columns:
-            pareto_data = base_inss_filtrada.groupby('STATUS_BENEFICIARIO')['QTD_BENEFICIOS'].sum().sort_values(ascending=False).reset_index()
-            if not pareto_data.empty and pareto_data['QTD_BENEFICIOS'].sum() > 0:
-                pareto_data['CUMSUM_BENEFICIOS'] = pareto_data['QTD_BENEFICIOS'].cumsum()
-                total_beneficios_pareto = pareto_data['QTD_BENEFICIOS'].sum()
-                pareto_data['CUMPERCENT_BENEFICIOS'] = (pareto_data['CUMSUM_BENEFICIOS'] / total_beneficios_pareto) * 100
-
-                fig_pareto = make_subplots(specs=[[{"secondary_y": True}]])
-                fig_pareto.add_trace(
-                    go.Bar(x=pareto_data['STATUS_BENEFICIARIO'], y=pareto_data['QTD_BENEFICIOS'], name='Qtd. Benefícios',
-                           marker_color=minha_paleta_de_cores_graficos[0], text=pareto_data['QTD_BENEFICIOS'],
-                           texttemplate='%{text:,.0f}', textposition='auto'),
-                    secondary_y=False,
-                )
-                fig_pareto.add_trace(
-                    go.Scatter(x=pareto_data['STATUS_BENEFICIARIO'], y=pareto_data['CUMPERCENT_BENEFICIOS'], name='% Acumulado',
-                               marker_color=minha_paleta_de_cores_graficos[1], yaxis='y2'),
-                    secondary_y=True,
-                )
-                fig_pareto.update_layout(title_text='Pareto por Status', height=altura_grafico, separators=plotly_separators_config, margin=dict(t=50, b=20, l=0, r=0))
-                fig_pareto.update_xaxes(title_text='Status do Beneficiário')
-                fig_pareto.update_yaxes(title_text='Qtd. Benefícios', secondary_y=False, tickformat=',.0f') 
-                fig_pareto.update_yaxes(title_text='% Acumulado', secondary_y=True, range=[0, 105], ticksuffix='%', tickformat='.0f')
-                st.plotly_chart(fig_pareto, use_container_width=True)
+        if 'STATUS_BENEFICIARIO' in dimensoes_cubo:
+            fig_pareto = obter_figura('pareto_status', figura_pareto_status, filtros)
+            if fig_pareto is not None:
+                exibir_grafico('pareto_status', fig_pareto)
             else:
                 st.warning("Dados insuficientes para Pareto por Status.")
         else:
@@ -328,31 +255,10 @@ else:
 
     with col2_linha2:
         st.subheader("Distribuição por Faixa Etária")
-        if 'IDADE_FAIXA' in base_inss_filtrada.columns and 'QTD_BENEFICIOS' in base_inss_filtrada.columns:
-            hist_idade_data = base_inss_filtrada.groupby('IDADE_FAIXA', as_index=False)['QTD_BENEFICIOS'].sum()
-            hist_idade_data = hist_idade_data[hist_idade_data['QTD_BENEFICIOS'] > 0]
-            if not hist_idade_data.empty:
-                try:
-                    hist_idade_data['sort_key'] = hist_idade_data['IDADE_FAIXA'].str.extract(r'(\d+)').astype(int)
-                    hist_idade_data = hist_idade_data.sort_values(by='sort_key').reset_index(drop=True)
-                except Exception:
-                    hist_idade_data = hist_idade_data.sort_values(by='IDADE_FAIXA').reset_index(drop=True)
-                
-                fig_hist_idade = px.bar(
-                    hist_idade_data, x='IDADE_FAIXA', y='QTD_BENEFICIOS',
-                    labels={'IDADE_FAIXA': 'Faixa Etária', 'QTD_BENEFICIOS': 'Quantidade de Benefícios'},
-                    color='IDADE_FAIXA', color_discrete_sequence=minha_paleta_de_cores_graficos,
-                    text='QTD_BENEFICIOS'
-                )
-                fig_hist_idade.update_layout(
-                    height=altura_grafico, separators=plotly_separators_config,
-                    yaxis_tickformat=',.0f', xaxis_title="Faixa Etária", yaxis_title="Quantidade de Benefícios",
-                    margin=dict(t=30, b=20, l=0, r=0),
-                    showlegend=(len(hist_idade_data['IDADE_FAIXA'].unique()) <= 10 and 'color' in fig_hist_idade.layout) 
-                )
-                fig_hist_idade.update_xaxes(type='category', categoryorder='array', categoryarray=hist_idade_data['IDADE_FAIXA'].tolist())
-                fig_hist_idade.update_traces(texttemplate='%{y:,.0f}', textposition='outside')
-                st.plotly_chart(fig_hist_idade, use_container_width=True)
+        if 'IDADE_FAIXA' in dimensoes_cubo:
+            fig_hist_idade = obter_figura('faixa_etaria', figura_faixa_etaria, filtros)
+            if fig_hist_idade is not None:
+                exibir_grafico('faixa_etaria', fig_hist_idade)
             else:
                 st.warning("Nenhuma faixa etária com benefícios para o histograma.")
         else:
@@ -360,34 +266,105 @@ else:
 
         st.markdown("---")
 
-    # LINHA 3 DE GRÁFICOS
+def linha_taxas(filtros):
+    col1_linha3, col2_linha3 = st.columns(2) # Gráfico de barras com a taxa por região / Gráfico de barras com a taxa por mês e sexo
+
     with col1_linha3:
         st.subheader("Taxa por Região (100k hab)")
-        if all(col in base_inss_filtrada.columns for col in ['REGIAO_PAIS', 'QTD_BENEFICIOS', 'POPULACAO']):
-            base_inss_agg_regiao_rate = base_inss_filtrada.groupby('REGIAO_PAIS').agg(QTD_BENEFICIOS_TOTAL=('QTD_BENEFICIOS', 'sum'), POPULACAO_DA_REGIAO=('POPULACAO', 'first')).reset_index()
-            base_inss_agg_regiao_rate = base_inss_agg_regiao_rate[base_inss_agg_regiao_rate['POPULACAO_DA_REGIAO'] > 0]
-            if not base_inss_agg_regiao_rate.empty:
-                base_inss_agg_regiao_rate['TAXA_CALCULADA_POR_REGIAO'] = (base_inss_agg_regiao_rate['QTD_BENEFICIOS_TOTAL'] / base_inss_agg_regiao_rate['POPULACAO_DA_REGIAO']) * 100000
-                base_inss_agg_regiao_rate = base_inss_agg_regiao_rate.sort_values(by='TAXA_CALCULADA_POR_REGIAO', ascending=False)
-                fig_bar_taxa_regiao = px.bar(base_inss_agg_regiao_rate, x='REGIAO_PAIS', y='TAXA_CALCULADA_POR_REGIAO', labels={'TAXA_CALCULADA_POR_REGIAO': 'Taxa por 100k hab.', 'REGIAO_PAIS': 'Região'}, color='REGIAO_PAIS', color_discrete_sequence=minha_paleta_de_cores_graficos)
-                fig_bar_taxa_regiao.update_layout(height=altura_grafico, margin=dict(t=30, b=40, l=0, r=0), showlegend=False, separators=plotly_separators_config, yaxis_tickformat=',.2f')
-                st.plotly_chart(fig_bar_taxa_regiao, use_container_width=True)
+        if 'POPULACAO' in cubo.columns:
+            fig_bar_taxa_regiao = obter_figura('taxa_regiao', figura_taxa_regiao, filtros)
+            if fig_bar_taxa_regiao is not None: exibir_grafico('taxa_regiao', fig_bar_taxa_regiao)
             else: st.warning("Não foi possível calcular a Taxa por Região.")
         else: st.warning("Colunas para Taxa por Região não encontradas.")
 
     with col2_linha3:
         st.subheader("Taxa por Mês e Sexo")
-        if all(col in base_inss_filtrada.columns for col in ['MES_STR', 'SEXO', 'QTD_BENEFICIOS', 'REGIAO_PAIS', 'POPULACAO']):
-            populacao_denominador_barras = 0
-            if regioes_selecionadas: populacao_denominador_barras = base_inss[base_inss['REGIAO_PAIS'].isin(regioes_selecionadas)].groupby('REGIAO_PAIS')['POPULACAO'].first().sum()
-            elif not base_inss.empty: populacao_denominador_barras = base_inss.groupby('REGIAO_PAIS')['POPULACAO'].first().sum()
-            if pd.isna(populacao_denominador_barras): populacao_denominador_barras = 0
-            if populacao_denominador_barras > 0:
-                base_inss_agg_bar = base_inss_filtrada.groupby(["MES_STR", "SEXO"]).agg(QTD_BENEFICIOS_AGRUPADO=('QTD_BENEFICIOS', 'sum')).reset_index()
-                base_inss_agg_bar["TAXA_CALCULADA"] = (base_inss_agg_bar["QTD_BENEFICIOS_AGRUPADO"] / populacao_denominador_barras) * 100000
-                base_inss_agg_bar = base_inss_agg_bar.sort_values("MES_STR")
-                fig_bar = px.bar(base_inss_agg_bar, x="MES_STR", y="TAXA_CALCULADA", color="SEXO", labels={"TAXA_CALCULADA": "Taxa por 100k hab.", "MES_STR": "Mês"}, barmode="group", color_discrete_sequence=minha_paleta_de_cores_graficos)
-                fig_bar.update_layout(height=altura_grafico, margin=dict(t=30, b=40, l=0, r=0), separators=plotly_separators_config, yaxis_tickformat=',.2f')
-                st.plotly_chart(fig_bar, use_container_width=True)
+        if 'SEXO' in dimensoes_cubo and 'POPULACAO' in cubo.columns:
+            fig_bar = obter_figura('taxa_mes_sexo', figura_taxa_mes_sexo, filtros)
+            if fig_bar is not None: exibir_grafico('taxa_mes_sexo', fig_bar)
             else: st.warning("População denominador zero ou N/D para Taxa por Mês e Sexo.")
-        else: st.warning("Colunas para Taxa por Mês e Sexo não encontradas.")
\ No newline at end of file
+        else: st.warning("Colunas para Taxa por Mês e Sexo não encontradas.")
+
+# Consulta à base de detalhamento; o resultado fica no cache das figuras, identificado também pela assinatura dos arquivos
+def obter_detalhe(nivel, filtros, ufs):
+    periodo_inicio, periodo_fim, regioes, cids = filtros
+    chave = ('detalhamento', nivel, ufs, assinatura_detalhe(caminho_detalhe)) + filtros
+    with instrumentacao.medir(f'calculo.detalhamento.{nivel.lower()}'):
+        return cache_figuras.obter(chave, lambda: consultar_detalhe(caminho_detalhe, nivel, periodo_inicio, periodo_fim, {'REGIAO_PAIS': regioes, 'CID_TIPO': cids, 'UF': ufs}))
+
+def linha_detalhamento(filtros):
+    col1_detalhe, col2_detalhe, col3_detalhe = st.columns(3) # Nível / indicador / UFs dos municípios
+
+    with col1_detalhe:
+        nivel = st.radio("Nível:", list(niveis_detalhe), format_func=niveis_detalhe.get, horizontal=True, key="nivel_detalhe")
+    with col2_detalhe:
+        medida = st.selectbox("Indicador:", list(rotulos_medidas), format_func=rotulos_medidas.get, key="medida_detalhe")
+
+    try:
+        ufs = ()
+        if nivel == 'MUNICIPIO':
+            with col3_detalhe:
+                ufs_disponiveis = obter_detalhe('UF', filtros, ())['UF'].dropna().tolist()
+                ufs = tuple(sorted(st.multiselect("UF:", ufs_disponiveis, key="ufs_detalhe")))
+        tabela_detalhe = obter_detalhe(nivel, filtros, ufs)
+    except Exception as e:
+        st.error(f"Erro ao consultar a base de detalhamento: {e}")
+        return
+
+    st.subheader(f"{rotulos_medidas[medida]} por {niveis_detalhe[nivel]}")
+    with instrumentacao.medir('calculo.detalhamento'):
+        fig_detalhe = cache_figuras.obter(('fig_detalhamento', nivel, medida, ufs, assinatura_detalhe(caminho_detalhe)) + filtros, lambda: figura_detalhamento(tabela_detalhe, nivel, medida))
+    if fig_detalhe is not None: exibir_grafico('detalhamento', fig_detalhe)
+    else: st.warning("Sem dados para o detalhamento com os filtros selecionados.")
+    st.dataframe(tabela_detalhe.rename(columns={nivel: niveis_detalhe[nivel], **rotulos_medidas}), use_container_width=True, hide_index=True)
+
+secoes_graficos = {
+    "Região e Tipo": linha_regiao_tipo,
+    "Status e Faixa Etária": linha_status_idade,
+    "Taxas por 100k hab.": linha_taxas,
+}
+# Detalhamento por UF e município, só quando a base de detalhamento foi gravada
+if existe_detalhe(caminho_detalhe):
+    secoes_graficos["UF e Município"] = linha_detalhamento
+
+# Só a seção escolhida é calculada; trocar de seção reexecuta apenas este fragmento, não a página inteira
+@st.fragment
+def secao_graficos(filtros):
+    # Reexecução só do fragmento (troca de seção): as medições formam uma nova execução
+    if instrumentacao.pagina_concluida:
+        instrumentacao.nova_execucao('fragmento')
+    secao = st.radio("Gráficos:", list(secoes_graficos), horizontal=True, key="secao_graficos", label_visibility="collapsed")
+    secoes_graficos[secao](filtros)
+    painel_instrumentacao()
+
+kpis = obter_figura('kpis', calcular_kpis, filtros_cubo)
+
+if kpis is None:
+    st.warning("Nenhum dado corresponde aos filtros selecionados.")
+    painel_instrumentacao()
+else:
+    # BIG NUMBERS
+    st.subheader("Indicadores Chave do Período Filtrado")
+
+    # Visual
+    #kpi_col1, kpi_col2, kpi_col3, kpi_col4 = st.columns(4)
+    #with kpi_col1:
+        #st.metric(label="Total de Benefícios", value=f"{kpis['total_beneficios']:,.0f}")
+    #with kpi_col2:
+        #st.metric(label="População Coberta", value=f"{kpis['populacao_coberta']:,.0f}" if kpis['populacao_coberta'] > 0 else "N/D")
+    #with kpi_col3:
+        #st.metric(label="Taxa Geral (por 100K hab.)", value=f"{kpis['taxa_geral']:,.2f}" if kpis['taxa_geral'] > 0 else "N/D")
+    #with kpi_col4:
+        #st.metric(label="Meses no Filtro", value=kpis['meses_cobertos'])
+
+    # Layout com 4 colunas
+    figuras_indicadores = obter_figura('figuras_kpis', lambda motor, filtros: figuras_kpis(kpis), filtros_cubo)
+    for coluna_kpi, nome_kpi, fig_kpi in zip(st.columns(4), kpis, figuras_indicadores):
+        with coluna_kpi:
+            exibir_grafico(nome_kpi, fig_kpi)
+
+    st.markdown("---")
+
+    secao_graficos(filtros_cubo)
+
+instrumentacao.pagina_concluida = True
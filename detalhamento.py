@@ -0,0 +1,213 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+try:
+    import duckdb
+except ImportError:  # opcional: sem o duckdb, as consultas são feitas pelo pyarrow.dataset
+    duckdb = None
+
+from tratamento import mapa_estados_regioes
+
+# Base de detalhamento: linhas tratadas em Parquet, uma pasta por mês (MES=AAAA-MM), para consultas por UF e município
+pasta_detalhe_padrao = 'output/detalhe'
+compressao = 'zstd'
+colunas_texto_detalhe = ['UF', 'MUNICIPIO', 'REGIAO_PAIS', 'CID_TIPO', 'SEXO', 'BENEF_TIPO', 'STATUS_BENEFICIARIO', 'IDADE_FAIXA',
+                         'QTD_SAL_MIN_FAIXA', 'TEMPO_FAIXA_BENEF', 'RAMO', 'ZONA']
+colunas_numericas_detalhe = ['IDADE', 'TEMPO_ESPERA_DESPACHO_DIAS', 'TEMPO_BENEF_DIAS', 'QTD_SALARIO_MIN']
+colunas_detalhe = colunas_texto_detalhe + colunas_numericas_detalhe
+niveis_detalhe = {'UF': 'UF', 'MUNICIPIO': 'Município'}
+
+# Indicadores das consultas: nome -> (agregação, coluna); as agregações têm o mesmo resultado nos dois motores
+medidas_detalhe = {
+    'QTD_BENEFICIOS': ('count', None),
+    'MEDIANA_ESPERA_DESPACHO_DIAS': ('median', 'TEMPO_ESPERA_DESPACHO_DIAS'),
+    'MEDIA_ESPERA_DESPACHO_DIAS': ('mean', 'TEMPO_ESPERA_DESPACHO_DIAS'),
+    'MEDIANA_TEMPO_BENEF_DIAS': ('median', 'TEMPO_BENEF_DIAS'),
+    'MEDIA_IDADE': ('mean', 'IDADE'),
+}
+rotulos_medidas = {
+    'QTD_BENEFICIOS': 'Qtd. Benefícios',
+    'MEDIANA_ESPERA_DESPACHO_DIAS': 'Mediana da espera do despacho (dias)',
+    'MEDIA_ESPERA_DESPACHO_DIAS': 'Média da espera do despacho (dias)',
+    'MEDIANA_TEMPO_BENEF_DIAS': 'Mediana do tempo de benefício (dias)',
+    'MEDIA_IDADE': 'Idade média',
+}
+funcoes_sql = {'count': 'count(*)', 'median': 'median("{}")', 'mean': 'avg("{}")'}
+
+# Sigla de cada estado escrito por extenso (as bases trazem o estado pela sigla ou pelo nome)
+siglas_estados = {
+    'acre': 'AC', 'amapa': 'AP', 'amapá': 'AP', 'amazonas': 'AM', 'para': 'PA', 'pará': 'PA', 'rondonia': 'RO', 'rondônia': 'RO',
+    'roraima': 'RR', 'tocantins': 'TO', 'alagoas': 'AL', 'bahia': 'BA', 'ceara': 'CE', 'ceará': 'CE', 'maranhao': 'MA',
+    'maranhão': 'MA', 'paraiba': 'PB', 'paraíba': 'PB', 'pernambuco': 'PE', 'piaui': 'PI', 'piauí': 'PI',
+    'rio grande do norte': 'RN', 'sergipe': 'SE', 'goias': 'GO', 'goiás': 'GO', 'mato grosso': 'MT', 'mato grosso do sul': 'MS',
+    'distrito federal': 'DF', 'espirito santo': 'ES', 'espírito santo': 'ES', 'minas gerais': 'MG', 'rio de janeiro': 'RJ',
+    'sao paulo': 'SP', 'são paulo': 'SP', 'parana': 'PR', 'paraná': 'PR', 'rio grande do sul': 'RS', 'santa catarina': 'SC',
+}
+
+
+def sigla_uf(estado):
+    texto = str(estado).strip()
+    if texto.lower() in siglas_estados:
+        return siglas_estados[texto.lower()]
+    return texto.upper() if texto.lower() in mapa_estados_regioes else texto
+
+
+def caminho_particao(pasta, mes):
+    return Path(pasta) / f"MES={pd.Period(mes, 'M')}"
+
+
+def arquivos_detalhe(pasta, nome=None):
+    """Arquivos Parquet da base de detalhamento (só os gravados a partir do arquivo mensal nome, se informado)."""
+    return sorted(Path(pasta).glob(f'MES=*/{nome}-*.parquet' if nome else 'MES=*/*.parquet'))
+
+
+def existe_detalhe(pasta):
+    return os.path.isdir(pasta) and bool(arquivos_detalhe(pasta))
+
+
+def assinatura_detalhe(pasta):
+    """(quantidade de arquivos, mtime mais recente em ns): muda sempre que a base de detalhamento é regravada."""
+    arquivos = arquivos_detalhe(pasta)
+    return len(arquivos), max((arquivo.stat().st_mtime_ns for arquivo in arquivos), default=0)
+
+
+def remover_detalhe(pasta, nome):
+    """Apaga as linhas gravadas a partir do arquivo mensal nome, antes de regravá-lo ou quando ele deixa de existir.
+
+    Retorna os arquivos apagados.
+    """
+    removidos = arquivos_detalhe(pasta, nome)
+    for arquivo in removidos:
+        arquivo.unlink()
+        if not any(arquivo.parent.iterdir()):
+            arquivo.parent.rmdir()
+    return removidos
+
+
+def _coluna_dicionario(serie, converter=str):
+    # Texto codificado como dicionário: a conversão é feita só nos valores distintos, e o Parquet já grava assim
+    codigos, unicos = pd.factorize(serie)
+    rotulos = pa.array([converter(valor) for valor in unicos], type=pa.string())
+    return pa.DictionaryArray.from_arrays(pa.array(codigos, type=pa.int32(), mask=codigos < 0), rotulos)
+
+
+def preparar_detalhe(base_tratada):
+    """Tabela Arrow com as colunas da base de detalhamento, a UF pela sigla e o mesmo esquema em todos os arquivos."""
+    colunas = {coluna: _coluna_dicionario(base_tratada[coluna], sigla_uf if coluna == 'UF' else str) for coluna in colunas_texto_detalhe}
+    for coluna in colunas_numericas_detalhe:
+        colunas[coluna] = pa.array(base_tratada[coluna], from_pandas=True)
+    return pa.table(colunas)
+
+
+def gravar_detalhe(base_tratada, pasta, nome, parte=0):
+    """Grava as linhas tratadas na pasta do mês de cada linha, como '<nome>-<parte>.parquet'.
+
+    Cada arquivo mensal (nome) e cada lote dele (parte) têm o seu arquivo; assim um arquivo
+    pode ser regravado sem reescrever o mês inteiro.
+    """
+    detalhe = preparar_detalhe(base_tratada)
+    codigos, meses = pd.factorize(pd.to_datetime(base_tratada['MES']).dt.to_period('M'))
+    for posicao, mes in enumerate(meses):
+        particao = caminho_particao(pasta, mes)
+        particao.mkdir(parents=True, exist_ok=True)
+        linhas = detalhe if len(meses) == 1 else detalhe.take(np.flatnonzero(codigos == posicao))
+        pq.write_table(linhas, particao / f'{nome}-{parte:05d}.parquet', compression=compressao)
+
+
+def motor_padrao():
+    return 'duckdb' if duckdb is not None else 'pyarrow'
+
+
+def _validar_colunas(colunas):
+    desconhecidas = [coluna for coluna in colunas if coluna not in colunas_detalhe]
+    if desconhecidas:
+        raise ValueError(f"Colunas fora da base de detalhamento: {', '.join(desconhecidas)}")
+
+
+def _consultar_duckdb(pasta, nivel, periodo_inicio, periodo_fim, selecoes, medidas):
+    condicoes, parametros = [], []
+    # MES é a chave das pastas: o filtro do período descarta as pastas fora dele sem abrir os arquivos
+    if periodo_inicio is not None:
+        condicoes.append('MES >= ?')
+        parametros.append(str(periodo_inicio))
+    if periodo_fim is not None:
+        condicoes.append('MES <= ?')
+        parametros.append(str(periodo_fim))
+    for coluna, valores in selecoes.items():
+        condicoes.append(f'"{coluna}" IN ({", ".join("?" * len(valores))})')
+        parametros.extend(valores)
+
+    expressoes = [f'{funcoes_sql[medidas_detalhe[medida][0]].format(medidas_detalhe[medida][1])} AS "{medida}"' for medida in medidas]
+    padrao = str(Path(pasta) / 'MES=*' / '*.parquet').replace("'", "''")
+    consulta = (f'SELECT "{nivel}", {", ".join(expressoes)} '
+                f"FROM read_parquet('{padrao}', hive_partitioning = true, hive_types = {{'MES': 'VARCHAR'}}) "
+                + (f'WHERE {" AND ".join(condicoes)} ' if condicoes else '')
+                + f'GROUP BY "{nivel}" ORDER BY "{nivel}"')
+    with duckdb.connect() as conexao:
+        return conexao.execute(consulta, parametros).df()
+
+
+def _consultar_pyarrow(pasta, nivel, periodo_inicio, periodo_fim, selecoes, medidas):
+    dataset = ds.dataset(pasta, format='parquet', partitioning=ds.partitioning(pa.schema([('MES', pa.string())]), flavor='hive'))
+    filtro = None
+    condicoes = []
+    if periodo_inicio is not None:
+        condicoes.append(ds.field('MES') >= str(periodo_inicio))
+    if periodo_fim is not None:
+        condicoes.append(ds.field('MES') <= str(periodo_fim))
+    condicoes += [ds.field(coluna).isin(list(valores)) for coluna, valores in selecoes.items()]
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+
+    # Só as colunas do nível e dos indicadores são lidas, e só das pastas e grupos de linhas que passam no filtro
+    colunas = list(dict.fromkeys([nivel] + [medidas_detalhe[medida][1] for medida in medidas if medidas_detalhe[medida][1]]))
+    linhas = dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+    # O nível volta como categoria (dicionário); em texto, a ordenação é a alfabética, como no duckdb
+    linhas[nivel] = linhas[nivel].astype(object)
+    agregacoes = {medida: (coluna or nivel, 'size' if funcao == 'count' else funcao) for medida, (funcao, coluna) in medidas_detalhe.items() if medida in medidas}
+    return linhas.groupby(nivel, dropna=False, sort=True).agg(**agregacoes).reset_index()
+
+
+def consultar_detalhe(pasta, nivel, periodo_inicio=None, periodo_fim=None, selecoes=None, medidas=None, motor=None):
+    """Indicadores da base de detalhamento por nível (ex.: UF ou MUNICIPIO), no período e nas seleções informadas.
+
+    Assim como no dashboard, uma lista vazia em selecoes não filtra. Os períodos podem ser
+    pd.Period mensais ou textos 'AAAA-MM'. O motor é o duckdb, se instalado, ou o pyarrow; nos
+    dois, só as pastas dos meses do período e as colunas usadas são lidas do disco.
+    """
+    selecoes = {coluna: list(valores) for coluna, valores in (selecoes or {}).items() if len(valores)}
+    medidas = list(medidas or medidas_detalhe)
+    _validar_colunas([nivel, *selecoes])
+    if any(medida not in medidas_detalhe for medida in medidas):
+        raise ValueError(f"Indicadores disponíveis: {', '.join(medidas_detalhe)}")
+    if not existe_detalhe(pasta):
+        raise FileNotFoundError(f"Base de detalhamento não encontrada em: {pasta}")
+
+    consultar = _consultar_duckdb if (motor or motor_padrao()) == 'duckdb' else _consultar_pyarrow
+    resultado = consultar(pasta, nivel, periodo_inicio, periodo_fim, selecoes, medidas)
+    # Mesmos tipos nos dois motores: contagem inteira e os demais indicadores em float
+    resultado[nivel] = resultado[nivel].astype(object).where(resultado[nivel].notna(), None)
+    for medida in medidas:
+        resultado[medida] = resultado[medida].astype('int64' if medidas_detalhe[medida][0] == 'count' else 'float64')
+    return resultado[[nivel] + medidas]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Consulta a base de detalhamento por UF ou município.")
+    parser.add_argument('--pasta', default=pasta_detalhe_padrao, help="Pasta da base de detalhamento.")
+    parser.add_argument('--nivel', default='UF', choices=list(niveis_detalhe))
+    parser.add_argument('--inicio', default=None, help="Primeiro mês (AAAA-MM).")
+    parser.add_argument('--fim', default=None, help="Último mês (AAAA-MM).")
+    parser.add_argument('--uf', nargs='*', default=[], help="Filtra as UFs (siglas).")
+    parser.add_argument('--motor', default=None, choices=['duckdb', 'pyarrow'])
+    args = parser.parse_args()
+
+    resultado = consultar_detalhe(args.pasta, args.nivel, args.inicio, args.fim, {'UF': args.uf}, motor=args.motor)
+    print(resultado.round(2).to_string(index=False))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+
+def codigo_mes(periodo):
+    """Código inteiro do mês (ano * 12 + mês - 1), usado para comparar períodos."""
+    return periodo.year * 12 + periodo.month - 1
+
+
+class MotorFiltros:
+    """Aplica os filtros da barra lateral (período, região e CID) com uma única máscara.
+
+    Os códigos de mês e das categorias são calculados uma vez na criação do motor. As linhas
+    de cada valor da coluna de partição (a DIMENSAO do cubo) ficam indexadas, então um filtro
+    só percorre as linhas da partição pedida e só materializa as colunas solicitadas.
+    """
+
+    def __init__(self, base, colunas_filtro=('REGIAO_PAIS', 'CID_TIPO'), coluna_particao='DIMENSAO'):
+        self.base = base
+        meses = pd.to_datetime(base['MES'])
+        self.meses = (meses.dt.year * 12 + meses.dt.month - 1).to_numpy(dtype=np.int32)
+
+        self.categorias = {}
+        self.codigos = {}
+        for coluna in colunas_filtro:
+            categorica = base[coluna].astype('category')
+            self.categorias[coluna] = {valor: codigo for codigo, valor in enumerate(categorica.cat.categories)}
+            self.codigos[coluna] = categorica.cat.codes.to_numpy()
+
+        particoes = base[coluna_particao].astype('category')
+        codigos_particao = particoes.cat.codes.to_numpy()
+        self.linhas_por_particao = {valor: np.flatnonzero(codigos_particao == codigo) for codigo, valor in enumerate(particoes.cat.categories)}
+
+    def _selecao(self, coluna, valores):
+        # Tabela de consulta por código; a última posição atende o código -1 (valor ausente)
+        categorias = self.categorias[coluna]
+        tabela = np.zeros(len(categorias) + 1, dtype=bool)
+        tabela[[categorias[valor] for valor in valores if valor in categorias]] = True
+        return tabela
+
+    def linhas(self, particao, periodo_inicio, periodo_fim, selecoes):
+        """Posições das linhas da partição que atendem ao período e às seleções.
+
+        Seleções vazias não filtram, assim como no dashboard.
+        """
+        linhas = self.linhas_por_particao.get(particao, np.empty(0, dtype=np.intp))
+        meses = self.meses[linhas]
+        mascara = (meses >= codigo_mes(periodo_inicio)) & (meses <= codigo_mes(periodo_fim))
+        for coluna, valores in selecoes.items():
+            if valores:
+                mascara &= self._selecao(coluna, valores)[self.codigos[coluna][linhas]]
+        return linhas[mascara]
+
+    def filtrar(self, particao, periodo_inicio, periodo_fim, selecoes, colunas=None):
+        linhas = self.linhas(particao, periodo_inicio, periodo_fim, selecoes)
+        colunas = list(self.base.columns) if colunas is None else [coluna for coluna in colunas if coluna in self.base.columns]
+        return self.base.iloc[linhas, [self.base.columns.get_loc(coluna) for coluna in colunas]]
+
+    def particao(self, particao):
+        return self.base.iloc[self.linhas_por_particao.get(particao, np.empty(0, dtype=np.intp))]
@@ -0,0 +1,237 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from cubo import dimensao_total, fatiar_cubo, populacao_por_regiao, somar_por
+from detalhamento import medidas_detalhe, niveis_detalhe, rotulos_medidas
+
+# Definição da paleta de cores para os gráficos
+minha_paleta_de_cores_graficos = ['#8A3FFC', '#FF8C00', '#A076F9', '#FFB74D', '#D946EF', '#FF7043']
+
+altura_grafico = 450
+plotly_separators_config = ',.' # Definindo o separador de milhar para os gráficos
+limite_barras_detalhe = 30 # Os municípios podem ser milhares: o gráfico mostra só os maiores valores
+
+
+def normalizar_filtros(data_inicio, data_fim, regioes, cids, todas_regioes=(), todos_cids=()):
+    """Estado dos filtros em forma canônica: (período início, período fim, regiões, CIDs).
+
+    As datas viram meses, as seleções ficam ordenadas e "todas selecionadas" equivale a
+    "nenhuma selecionada" (as duas não filtram), para que estados equivalentes tenham a mesma chave.
+    """
+    regioes = tuple(sorted(regioes))
+    cids = tuple(sorted(cids))
+    if set(regioes) == set(todas_regioes):
+        regioes = ()
+    if set(cids) == set(todos_cids):
+        cids = ()
+    return pd.Period(data_inicio, 'M'), pd.Period(data_fim, 'M'), regioes, cids
+
+
+class CacheFiguras:
+    """Cache LRU das figuras, compartilhado entre as sessões, com contadores de acertos e falhas."""
+
+    def __init__(self, tamanho_maximo=256):
+        self.tamanho_maximo = tamanho_maximo
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, construir):
+        with self._trava:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+
+        valor = construir()
+
+        with self._trava:
+            self.falhas += 1
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+        return valor
+
+    def estatisticas(self):
+        with self._trava:
+            return {'itens': len(self._itens), 'tamanho_maximo': self.tamanho_maximo, 'acertos': self.acertos, 'falhas': self.falhas}
+
+
+def calcular_kpis(motor, filtros):
+    """Indicadores do período filtrado, ou None se nenhum dado corresponder aos filtros."""
+    base_inss_filtrada = fatiar_cubo(motor, dimensao_total, *filtros)
+    if base_inss_filtrada.empty:
+        return None
+
+    total_beneficios_kpi = base_inss_filtrada['QTD_BENEFICIOS'].sum()
+
+    if 'REGIAO_PAIS' in base_inss_filtrada.columns and 'POPULACAO' in base_inss_filtrada.columns:
+        populacao_df_sum = base_inss_filtrada.groupby('REGIAO_PAIS', observed=True)['POPULACAO'].first()
+        populacao_coberta_kpi = populacao_df_sum.sum() if not populacao_df_sum.empty else 0
+    else:
+        populacao_coberta_kpi = 0
+
+    if pd.isna(populacao_coberta_kpi):
+        populacao_coberta_kpi = 0
+
+    taxa_geral_kpi = (total_beneficios_kpi / populacao_coberta_kpi) * 100000 if populacao_coberta_kpi > 0 else 0
+    meses_cobertos_kpi = base_inss_filtrada['MES'].nunique()
+
+    return {'total_beneficios': total_beneficios_kpi, 'populacao_coberta': populacao_coberta_kpi, 'taxa_geral': taxa_geral_kpi, 'meses_cobertos': meses_cobertos_kpi}
+
+
+def figura_indicador(valor, titulo, formato):
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        value=valor,
+        title={"text": titulo},
+        number={"valueformat": formato}
+    ))
+    # Configurando os separadores no layout da figura (',' para decimal, '.' para milhar)
+    fig.update_layout(
+        height=180,
+        margin=dict(t=30, b=0, l=0, r=0),
+        separators=',.'
+    )
+    return fig
+
+
+def figuras_kpis(kpis):
+    return [
+        figura_indicador(kpis['total_beneficios'], "Total de Benefícios", ","),
+        figura_indicador(kpis['populacao_coberta'], "População Coberta", ","),
+        figura_indicador(round(kpis['taxa_geral'], 2), "Taxa Geral (por 100k hab.)", ",.2f"),
+        # ",d" formata como inteiro e habilita agrupamento de milhares.
+        figura_indicador(kpis['meses_cobertos'], "Meses no Filtro", ",d"),
+    ]
+
+
+def figura_rosca_regiao(motor, filtros):
+    base_inss_filtrada = fatiar_cubo(motor, dimensao_total, *filtros)
+    base_inss_regiao_qtd = base_inss_filtrada.groupby('REGIAO_PAIS', observed=True)['QTD_BENEFICIOS'].sum().reset_index()
+    base_inss_regiao_qtd = base_inss_regiao_qtd[base_inss_regiao_qtd['QTD_BENEFICIOS'] > 0]
+    if base_inss_regiao_qtd.empty or base_inss_regiao_qtd['QTD_BENEFICIOS'].sum() <= 0:
+        return None
+    total_beneficios_rosca = base_inss_regiao_qtd['QTD_BENEFICIOS'].sum()
+    regiao_maior_valor_linha = base_inss_regiao_qtd.loc[base_inss_regiao_qtd['QTD_BENEFICIOS'].idxmax()]
+    nome_maior_regiao = regiao_maior_valor_linha['REGIAO_PAIS']
+    percentual_maior_regiao = (regiao_maior_valor_linha['QTD_BENEFICIOS'] / total_beneficios_rosca) * 100
+    fig_rosca = px.pie(base_inss_regiao_qtd, names='REGIAO_PAIS', values='QTD_BENEFICIOS', hole=0.5, color_discrete_sequence=minha_paleta_de_cores_graficos)
+    fig_rosca.update_layout(height=altura_grafico, annotations=[dict(text=f"<b>{nome_maior_regiao}</b><br>{(percentual_maior_regiao).round()}%", x=0.5, y=0.5, font_size=16, showarrow=False)], legend_title_text='Regiões', margin=dict(t=30, b=20, l=0, r=0), separators=plotly_separators_config)
+    fig_rosca.update_traces(textposition='outside', textinfo='percent+label')
+    return fig_rosca
+
+
+def figura_tipo_beneficio(motor, filtros):
+    benef_tipo_agg = somar_por(fatiar_cubo(motor, 'BENEF_TIPO', *filtros), 'BENEF_TIPO')
+    benef_tipo_agg = benef_tipo_agg[benef_tipo_agg['QTD_BENEFICIOS'] > 0]
+    benef_tipo_agg = benef_tipo_agg.sort_values(by='QTD_BENEFICIOS', ascending=False)
+    if benef_tipo_agg.empty:
+        return None
+    fig_bar_benef_tipo = px.bar(benef_tipo_agg, x='QTD_BENEFICIOS', y='BENEF_TIPO', orientation='h', labels={'QTD_BENEFICIOS': 'Qtd. Benefícios', 'BENEF_TIPO': 'Tipo de Benefício'}, text='QTD_BENEFICIOS', color='BENEF_TIPO', color_discrete_sequence=minha_paleta_de_cores_graficos)
+    fig_bar_benef_tipo.update_layout(height=altura_grafico, yaxis={'categoryorder':'total ascending'}, margin=dict(t=30, b=40, l=0, r=0), showlegend=False, separators=plotly_separators_config)
+    fig_bar_benef_tipo.update_traces(texttemplate='%{x:,.0f}', textposition='outside')
+    return fig_bar_benef_tipo
+
+
+def figura_pareto_status(motor, filtros):
+    pareto_data = somar_por(fatiar_cubo(motor, 'STATUS_BENEFICIARIO', *filtros), 'STATUS_BENEFICIARIO').sort_values(by='QTD_BENEFICIOS', ascending=False).reset_index(drop=True)
+    if pareto_data.empty or pareto_data['QTD_BENEFICIOS'].sum() <= 0:
+        return None
+    pareto_data['CUMSUM_BENEFICIOS'] = pareto_data['QTD_BENEFICIOS'].cumsum()
+    total_beneficios_pareto = pareto_data['QTD_BENEFICIOS'].sum()
+    pareto_data['CUMPERCENT_BENEFICIOS'] = (pareto_data['CUMSUM_BENEFICIOS'] / total_beneficios_pareto) * 100
+
+    fig_pareto = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_pareto.add_trace(
+        go.Bar(x=pareto_data['STATUS_BENEFICIARIO'], y=pareto_data['QTD_BENEFICIOS'], name='Qtd. Benefícios',
+               marker_color=minha_paleta_de_cores_graficos[0], text=pareto_data['QTD_BENEFICIOS'],
+               texttemplate='%{text:,.0f}', textposition='auto'),
+        secondary_y=False,
+    )
+    fig_pareto.add_trace(
+        go.Scatter(x=pareto_data['STATUS_BENEFICIARIO'], y=pareto_data['CUMPERCENT_BENEFICIOS'], name='% Acumulado',
+                   marker_color=minha_paleta_de_cores_graficos[1], yaxis='y2'),
+        secondary_y=True,
+    )
+    fig_pareto.update_layout(title_text='Pareto por Status', height=altura_grafico, separators=plotly_separators_config, margin=dict(t=50, b=20, l=0, r=0))
+    fig_pareto.update_xaxes(title_text='Status do Beneficiário')
+    fig_pareto.update_yaxes(title_text='Qtd. Benefícios', secondary_y=False, tickformat=',.0f')
+    fig_pareto.update_yaxes(title_text='% Acumulado', secondary_y=True, range=[0, 105], ticksuffix='%', tickformat='.0f')
+    return fig_pareto
+
+
+def figura_faixa_etaria(motor, filtros):
+    hist_idade_data = somar_por(fatiar_cubo(motor, 'IDADE_FAIXA', *filtros), 'IDADE_FAIXA')
+    hist_idade_data = hist_idade_data[hist_idade_data['QTD_BENEFICIOS'] > 0]
+    if hist_idade_data.empty:
+        return None
+    try:
+        hist_idade_data['sort_key'] = hist_idade_data['IDADE_FAIXA'].str.extract(r'(\d+)').astype(int)
+        hist_idade_data = hist_idade_data.sort_values(by='sort_key').reset_index(drop=True)
+    except Exception:
+        hist_idade_data = hist_idade_data.sort_values(by='IDADE_FAIXA').reset_index(drop=True)
+
+    fig_hist_idade = px.bar(
+        hist_idade_data, x='IDADE_FAIXA', y='QTD_BENEFICIOS',
+        labels={'IDADE_FAIXA': 'Faixa Etária', 'QTD_BENEFICIOS': 'Quantidade de Benefícios'},
+        color='IDADE_FAIXA', color_discrete_sequence=minha_paleta_de_cores_graficos,
+        text='QTD_BENEFICIOS'
+    )
+    fig_hist_idade.update_layout(
+        height=altura_grafico, separators=plotly_separators_config,
+        yaxis_tickformat=',.0f', xaxis_title="Faixa Etária", yaxis_title="Quantidade de Benefícios",
+        margin=dict(t=30, b=20, l=0, r=0),
+        showlegend=(len(hist_idade_data['IDADE_FAIXA'].unique()) <= 10 and 'color' in fig_hist_idade.layout)
+    )
+    fig_hist_idade.update_xaxes(type='category', categoryorder='array', categoryarray=hist_idade_data['IDADE_FAIXA'].tolist())
+    fig_hist_idade.update_traces(texttemplate='%{y:,.0f}', textposition='outside')
+    return fig_hist_idade
+
+
+def figura_taxa_regiao(motor, filtros):
+    base_inss_filtrada = fatiar_cubo(motor, dimensao_total, *filtros)
+    base_inss_agg_regiao_rate = base_inss_filtrada.groupby('REGIAO_PAIS', observed=True).agg(QTD_BENEFICIOS_TOTAL=('QTD_BENEFICIOS', 'sum'), POPULACAO_DA_REGIAO=('POPULACAO', 'first')).reset_index()
+    base_inss_agg_regiao_rate = base_inss_agg_regiao_rate[base_inss_agg_regiao_rate['POPULACAO_DA_REGIAO'] > 0]
+    if base_inss_agg_regiao_rate.empty:
+        return None
+    base_inss_agg_regiao_rate['TAXA_CALCULADA_POR_REGIAO'] = (base_inss_agg_regiao_rate['QTD_BENEFICIOS_TOTAL'] / base_inss_agg_regiao_rate['POPULACAO_DA_REGIAO']) * 100000
+    base_inss_agg_regiao_rate = base_inss_agg_regiao_rate.sort_values(by='TAXA_CALCULADA_POR_REGIAO', ascending=False)
+    fig_bar_taxa_regiao = px.bar(base_inss_agg_regiao_rate, x='REGIAO_PAIS', y='TAXA_CALCULADA_POR_REGIAO', labels={'TAXA_CALCULADA_POR_REGIAO': 'Taxa por 100k hab.', 'REGIAO_PAIS': 'Região'}, color='REGIAO_PAIS', color_discrete_sequence=minha_paleta_de_cores_graficos)
+    fig_bar_taxa_regiao.update_layout(height=altura_grafico, margin=dict(t=30, b=40, l=0, r=0), showlegend=False, separators=plotly_separators_config, yaxis_tickformat=',.2f')
+    return fig_bar_taxa_regiao
+
+
+def figura_taxa_mes_sexo(motor, filtros):
+    # Denominador: população das regiões selecionadas (ou de todas), independente do período e do CID
+    regioes_selecionadas = filtros[2]
+    populacao_denominador_barras = populacao_por_regiao(motor.particao(dimensao_total), regioes_selecionadas).sum()
+    if pd.isna(populacao_denominador_barras) or populacao_denominador_barras <= 0:
+        return None
+    base_inss_agg_bar = somar_por(fatiar_cubo(motor, 'SEXO', *filtros), 'SEXO', 'MES').rename(columns={'QTD_BENEFICIOS': 'QTD_BENEFICIOS_AGRUPADO'})
+    base_inss_agg_bar["MES_STR"] = base_inss_agg_bar["MES"].dt.strftime('%Y-%m')
+    base_inss_agg_bar["TAXA_CALCULADA"] = (base_inss_agg_bar["QTD_BENEFICIOS_AGRUPADO"] / populacao_denominador_barras) * 100000
+    base_inss_agg_bar = base_inss_agg_bar.sort_values("MES_STR")
+    fig_bar = px.bar(base_inss_agg_bar, x="MES_STR", y="TAXA_CALCULADA", color="SEXO", labels={"TAXA_CALCULADA": "Taxa por 100k hab.", "MES_STR": "Mês"}, barmode="group", color_discrete_sequence=minha_paleta_de_cores_graficos)
+    fig_bar.update_layout(height=altura_grafico, margin=dict(t=30, b=40, l=0, r=0), separators=plotly_separators_config, yaxis_tickformat=',.2f')
+    return fig_bar
+
+
+def figura_detalhamento(tabela, nivel, medida):
+    """Barras do indicador por UF ou município, a partir do resultado de detalhamento.consultar_detalhe."""
+    dados = tabela.dropna(subset=[nivel, medida])
+    dados = dados[dados['QTD_BENEFICIOS'] > 0].nlargest(limite_barras_detalhe, medida)
+    if dados.empty:
+        return None
+    formato = '%{x:,.0f}' if medidas_detalhe[medida][0] == 'count' else '%{x:,.1f}'
+    fig_detalhe = px.bar(dados, x=medida, y=nivel, orientation='h', labels={medida: rotulos_medidas[medida], nivel: niveis_detalhe[nivel]}, text=medida, color_discrete_sequence=minha_paleta_de_cores_graficos)
+    fig_detalhe.update_layout(height=max(altura_grafico, 25 * len(dados)), yaxis={'categoryorder': 'total ascending', 'type': 'category'}, margin=dict(t=30, b=40, l=0, r=0), showlegend=False, separators=plotly_separators_config)
+    fig_detalhe.update_traces(texttemplate=formato, textposition='outside')
+    return fig_detalhe
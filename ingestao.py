@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from armazenamento import salvar_base_compacta
+from carregamento import assinatura_arquivo, assinatura_codigo, calcular_chave, hash_arquivo
+from cubo import gerar_cubo, salvar_cubo
+from detalhamento import arquivos_detalhe, gravar_detalhe, pasta_detalhe_padrao, remover_detalhe
+from tratamento import agregar_base, calcular_taxa, colunas_agrupamento, colunas_data, colunas_desejadas, labels_idade, sufixo_texto, tratar_base
+
+nome_manifesto = 'manifesto.json'
+
+# Cópia colunar de cada arquivo Excel, gravada ao lado do original (ex.: ben_ago_24.cache.parquet)
+sufixo_cache = '.cache.parquet'
+chave_metadados_cache = b'inss_origem'
+
+# Linhas por lote no modo em lotes (memória limitada pelo lote e pela quantidade de grupos, não pelo arquivo)
+tamanho_lote_padrao = 250_000
+
+
+def caminho_cache(arquivo_excel):
+    arquivo_excel = Path(arquivo_excel)
+    return arquivo_excel.with_name(arquivo_excel.stem + sufixo_cache)
+
+
+def _separar_colunas_mistas(base, colunas=None):
+    # O parquet não aceita colunas com tipos misturados (ex.: datas do Excel junto com '00/00/0000'),
+    # então os textos vão para uma coluna auxiliar e os demais valores ficam tipados na coluna original
+    colunas_mistas, colunas_none = [], []
+    for coluna in base.columns[base.dtypes == object]:
+        if (colunas is not None and coluna not in colunas) or coluna.endswith(sufixo_texto) or pd.api.types.infer_dtype(base[coluna], skipna=True) not in ('mixed', 'mixed-integer'):
+            continue
+        valores = base[coluna]
+        eh_texto = valores.map(lambda valor: isinstance(valor, str)).astype(bool)
+        if eh_texto.all() or not eh_texto.any():
+            continue
+        # Valores ausentes voltam como None ou NaN, conforme estavam na leitura
+        ausentes = valores[valores.isna()]
+        if len(ausentes) and all(valor is None for valor in ausentes):
+            colunas_none.append(coluna)
+        if not colunas_mistas:
+            # A base só é copiada se houver alguma coluna mista
+            base = base.copy()
+        base[coluna + sufixo_texto] = valores.where(eh_texto)
+        numeros = valores.where(~eh_texto)
+        # Inteiros continuam inteiros (Int64, com <NA> nas linhas de texto), e não float com NaN
+        if pd.api.types.infer_dtype(numeros, skipna=True) == 'integer':
+            base[coluna] = numeros.astype('Int64')
+        else:
+            base[coluna] = pd.Series(numeros.tolist(), index=base.index).infer_objects()
+        colunas_mistas.append(coluna)
+    return base, colunas_mistas, colunas_none
+
+
+def _juntar_colunas_mistas(base, colunas_mistas, colunas_none=()):
+    for coluna in colunas_mistas:
+        texto = base.pop(coluna + sufixo_texto)
+        valores = base[coluna].astype(object)
+        valores = valores.where(valores.notna(), None if coluna in colunas_none else np.nan)
+        base[coluna] = valores.where(texto.isna(), texto)
+    return base
+
+
+def gravar_base_bruta(base, caminho, origem=None):
+    """Grava as linhas brutas em parquet, guardando a origem e as colunas mistas nos metadados."""
+    base, colunas_mistas, colunas_none = _separar_colunas_mistas(base)
+    origem = {**(origem or {}), 'colunas_mistas': colunas_mistas, 'colunas_mistas_none': colunas_none}
+    tabela = pa.Table.from_pandas(base, preserve_index=False)
+    metadados = {**(tabela.schema.metadata or {}), chave_metadados_cache: json.dumps(origem).encode('utf-8')}
+    pq.write_table(tabela.replace_schema_metadata(metadados), caminho)
+
+
+def ler_origem(caminho):
+    metadados = pq.read_schema(caminho).metadata or {}
+    if chave_metadados_cache not in metadados:
+        return None
+    return json.loads(metadados[chave_metadados_cache])
+
+
+def _colunas_mistas(caminho, separar_mistas=False):
+    # Colunas mistas a juntar na leitura; com separar_mistas, as de datas continuam separadas
+    # (só normalizar_datas sabe ler '<coluna>__texto') e as demais, como UF, voltam com os textos
+    origem = ler_origem(caminho) or {}
+    colunas_mistas = origem.get('colunas_mistas', [])
+    if separar_mistas:
+        colunas_mistas = [coluna for coluna in colunas_mistas if coluna not in colunas_data]
+    return colunas_mistas, origem.get('colunas_mistas_none', [])
+
+
+def ler_base_bruta(caminho, separar_mistas=False):
+    """Lê as linhas brutas; com separar_mistas, as colunas de datas mistas ficam como gravadas (datas e '<coluna>__texto')."""
+    base = pq.read_table(caminho).to_pandas()
+    return _juntar_colunas_mistas(base, *_colunas_mistas(caminho, separar_mistas))
+
+
+def salvar_cache(base, arquivo_excel):
+    mtime_ns, tamanho = assinatura_arquivo(arquivo_excel)
+    gravar_base_bruta(base, caminho_cache(arquivo_excel), {'mtime_ns': mtime_ns, 'tamanho': tamanho, 'colunas': colunas_desejadas})
+
+
+def cache_valido(arquivo_excel):
+    caminho = caminho_cache(arquivo_excel)
+    if not caminho.exists():
+        return False
+    origem = ler_origem(caminho)
+    if origem is None:
+        return False
+    mtime_ns, tamanho = assinatura_arquivo(arquivo_excel)
+    return (origem['mtime_ns'], origem['tamanho'], origem['colunas']) == (mtime_ns, tamanho, colunas_desejadas)
+
+
+def ler_cache(arquivo_excel, separar_mistas=False):
+    """Retorna a cópia colunar do arquivo, ou None se não existir ou estiver desatualizada."""
+    if not cache_valido(arquivo_excel):
+        return None
+    return ler_base_bruta(caminho_cache(arquivo_excel), separar_mistas)
+
+
+def ler_lotes_parquet(caminho, tamanho_lote=tamanho_lote_padrao, separar_mistas=False):
+    """Lê as linhas brutas gravadas por gravar_base_bruta em lotes de até tamanho_lote linhas."""
+    colunas_mistas, colunas_none = _colunas_mistas(caminho, separar_mistas)
+    for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho_lote):
+        yield _juntar_colunas_mistas(lote.to_pandas(), colunas_mistas, colunas_none)
+
+
+def _ler_lotes_planilha(arquivo_excel, tamanho_lote):
+    # O openpyxl em modo somente leitura percorre a planilha linha a linha, sem carregá-la inteira
+    livro = openpyxl.load_workbook(arquivo_excel, read_only=True, data_only=True)
+    try:
+        linhas = livro.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, ())
+        while lote := list(islice(linhas, tamanho_lote)):
+            # Linhas totalmente vazias são ignoradas, como no pd.read_excel
+            lote = [linha for linha in lote if any(valor is not None for valor in linha)]
+            base = pd.DataFrame(lote, columns=cabecalho)
+            yield base.loc[:, base.columns.isin(colunas_desejadas)].reindex(columns=colunas_desejadas)
+    finally:
+        livro.close()
+
+
+def ler_lotes(arquivo_excel, tamanho_lote=tamanho_lote_padrao, separar_mistas=False):
+    """Lê uma base mensal em lotes de linhas, pela cópia colunar se estiver atualizada ou direto do Excel."""
+    if cache_valido(arquivo_excel):
+        return ler_lotes_parquet(caminho_cache(arquivo_excel), tamanho_lote, separar_mistas)
+    return _ler_lotes_planilha(arquivo_excel, tamanho_lote)
+
+
+def ler_arquivo_excel(arquivo_excel, usar_cache=True, separar_mistas=False):
+    """Lê uma base mensal mantendo apenas as colunas desejadas.
+
+    O Excel só é interpretado na primeira leitura (o openpyxl é aberto em modo somente leitura
+    pelo pandas e as colunas fora de colunas_desejadas são descartadas durante a leitura);
+    nas seguintes, a cópia colunar ao lado do arquivo é usada. Com separar_mistas, as colunas
+    de datas com textos chegam separadas, como tratamento.normalizar_datas lê mais rápido.
+    """
+    if usar_cache:
+        base = ler_cache(arquivo_excel, separar_mistas)
+        if base is not None:
+            return base
+
+    base = pd.read_excel(arquivo_excel, usecols=lambda coluna: coluna in colunas_desejadas).reindex(columns=colunas_desejadas)
+    if usar_cache:
+        salvar_cache(base, arquivo_excel)
+    return _separar_colunas_mistas(base, colunas_data)[0] if separar_mistas else base
+
+
+def ler_bases_excel(arquivos, processos=None, separar_mistas=False):
+    """Lê os arquivos mensais em paralelo, um arquivo por processo, na ordem recebida."""
+    arquivos = list(arquivos)
+    bases = {}
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = {executor.submit(ler_arquivo_excel, arquivo, True, separar_mistas): arquivo for arquivo in arquivos}
+        for futuro in as_completed(futuros):
+            arquivo = futuros[futuro]
+            try:
+                bases[arquivo] = futuro.result()
+                print(f"Lido o arquivo: {arquivo.name}")
+            except Exception as e:
+                print(f"Erro ao processar {arquivo.name}: {e}")
+    return [bases[arquivo] for arquivo in arquivos if arquivo in bases]
+
+
+def ler_manifesto(pasta_particoes):
+    caminho = Path(pasta_particoes) / nome_manifesto
+    if not caminho.exists():
+        return {}
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def salvar_manifesto(pasta_particoes, manifesto):
+    # Gravando em um arquivo temporário antes de substituir, para não corromper o manifesto
+    caminho = Path(pasta_particoes) / nome_manifesto
+    caminho_tmp = caminho.with_suffix('.tmp')
+    with open(caminho_tmp, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+    os.replace(caminho_tmp, caminho)
+
+
+def somar_contagens(contagens):
+    """Junta contagens parciais (de lotes ou de meses), somando QTD_BENEFICIOS dos grupos repetidos."""
+    base = pd.concat(contagens, ignore_index=True)
+    return base.groupby(colunas_agrupamento, observed=True)['QTD_BENEFICIOS'].sum().reset_index()
+
+
+def agregar_em_lotes(lotes, pasta_detalhe=None, nome_detalhe=None):
+    """Map-reduce sobre os lotes: cada lote é tratado e contado, e a contagem acumulada é somada a cada lote.
+
+    Só um lote de linhas brutas e a contagem acumulada (um registro por grupo) ficam em memória.
+    Com pasta_detalhe, as linhas tratadas de cada lote também vão para a base de detalhamento.
+    """
+    acumulado = None
+    for parte, lote in enumerate(lotes):
+        base_lote = tratar_base(lote)
+        if pasta_detalhe:
+            gravar_detalhe(base_lote, pasta_detalhe, nome_detalhe, parte)
+        contagem = agregar_base(base_lote, observed=True)
+        acumulado = contagem if acumulado is None else somar_contagens([acumulado, contagem])
+    if acumulado is None:
+        return pd.DataFrame(columns=colunas_agrupamento + ['QTD_BENEFICIOS'])
+    return acumulado
+
+
+def processar_mes(arquivo_excel, tamanho_lote=None, pasta_detalhe=None):
+    """Limpa, classifica e agrega um único arquivo mensal (apenas grupos com benefícios).
+
+    Com tamanho_lote, o arquivo é lido e agregado em lotes, sem montar a base do mês inteira.
+    Com pasta_detalhe, as linhas tratadas do arquivo substituem as gravadas antes na base de detalhamento.
+    """
+    nome = Path(arquivo_excel).stem
+    if pasta_detalhe:
+        remover_detalhe(pasta_detalhe, nome)
+    if tamanho_lote:
+        return agregar_em_lotes(ler_lotes(arquivo_excel, tamanho_lote, separar_mistas=True), pasta_detalhe, nome)
+    base_mes = tratar_base(ler_arquivo_excel(arquivo_excel, separar_mistas=True))
+    if pasta_detalhe:
+        gravar_detalhe(base_mes, pasta_detalhe, nome)
+    return agregar_base(base_mes, observed=True)
+
+
+def juntar_particoes(particoes):
+    """Soma as contagens das partições mensais e recalcula população e taxa."""
+    base = pd.concat(particoes, ignore_index=True)
+    base['IDADE_FAIXA'] = pd.Categorical(base['IDADE_FAIXA'], categories=labels_idade)
+    # observed=False reproduz o produto cartesiano de grupos da agregação feita sobre a base inteira
+    base_tratada = base.groupby(colunas_agrupamento, observed=False)['QTD_BENEFICIOS'].sum().reset_index()
+    return calcular_taxa(base_tratada)
+
+
+def ingerir_incremental(caminho_bases, padrao_arquivos, pasta_particoes, processos=None, tamanho_lote=None, pasta_detalhe=None):
+    """Processa só os arquivos novos ou alterados e junta todas as partições mensais.
+
+    Cada arquivo é identificado pelo SHA-256 do conteúdo, registrado no manifesto da
+    pasta de partições junto com a chave do código de tratamento (processar_mes e tudo o que
+    ele usa, como tratar_base, bins_idade e mapa_cid_letra); arquivos já processados com o
+    mesmo conteúdo e o mesmo tratamento não são relidos. Os
+    arquivos pendentes são processados em paralelo, e cada processo devolve apenas a
+    partição já agregada do seu mês. Com tamanho_lote, cada mês é agregado em lotes
+    (ver agregar_em_lotes), e a memória de cada processo não depende do tamanho do arquivo.
+    Com pasta_detalhe, as linhas tratadas também são mantidas na base de detalhamento
+    (ver detalhamento.py), e os arquivos que ainda não estão nela são reprocessados.
+    Sem pasta_detalhe, se a pasta padrão do detalhamento existir, os meses dos arquivos
+    alterados ou removidos são apagados dela, para o dashboard não mostrar linhas antigas.
+    """
+    pasta_particoes = Path(pasta_particoes)
+    pasta_particoes.mkdir(parents=True, exist_ok=True)
+    manifesto = ler_manifesto(pasta_particoes)
+    chave_tratamento = calcular_chave(assinatura_codigo(processar_mes))
+    pasta_detalhe_existente = pasta_detalhe or (pasta_detalhe_padrao if Path(pasta_detalhe_padrao).is_dir() else None)
+
+    arquivos = sorted(Path(caminho_bases).glob(padrao_arquivos))
+    nomes_atuais = {arquivo.name for arquivo in arquivos}
+
+    # Removendo partições de arquivos que não existem mais
+    for nome in list(manifesto):
+        if nome not in nomes_atuais:
+            (pasta_particoes / manifesto.pop(nome)['particao']).unlink(missing_ok=True)
+            if pasta_detalhe_existente:
+                remover_detalhe(pasta_detalhe_existente, Path(nome).stem)
+            print(f"Partição removida: {nome}")
+
+    pendentes = {}
+    for arquivo_excel in arquivos:
+        checksum = hash_arquivo(arquivo_excel)
+        registro = manifesto.get(arquivo_excel.name)
+        detalhe_gravado = not pasta_detalhe or bool(arquivos_detalhe(pasta_detalhe, arquivo_excel.stem))
+        tratamento_igual = registro is not None and registro.get('tratamento') == chave_tratamento
+        if registro and registro['checksum'] == checksum and (pasta_particoes / registro['particao']).exists() and detalhe_gravado and tratamento_igual:
+            print(f"Sem alterações: {arquivo_excel.name}")
+        else:
+            if registro and not tratamento_igual:
+                print(f"Tratamento alterado: {arquivo_excel.name}")
+            pendentes[arquivo_excel] = checksum
+            if not pasta_detalhe and pasta_detalhe_existente and remover_detalhe(pasta_detalhe_existente, arquivo_excel.stem):
+                print(f"Detalhamento removido: {arquivo_excel.name} (use --detalhe para gravá-lo de novo)")
+
+    if pendentes:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            futuros = {executor.submit(processar_mes, arquivo, tamanho_lote, pasta_detalhe): arquivo for arquivo in pendentes}
+            for futuro in as_completed(futuros):
+                arquivo_excel = futuros[futuro]
+                particao = futuro.result()
+                nome_particao = f"{arquivo_excel.stem}.parquet"
+                particao.to_parquet(pasta_particoes / nome_particao, index=False)
+                manifesto[arquivo_excel.name] = {'checksum': pendentes[arquivo_excel], 'tratamento': chave_tratamento, 'particao': nome_particao, 'grupos': len(particao)}
+                salvar_manifesto(pasta_particoes, manifesto)
+                print(f"Processado o arquivo: {arquivo_excel.name}")
+
+    salvar_manifesto(pasta_particoes, manifesto)
+
+    particoes = [pd.read_parquet(pasta_particoes / registro['particao']) for registro in manifesto.values()]
+    if not particoes:
+        print("Nenhum arquivo encontrado ou processado.")
+        return calcular_taxa(pd.DataFrame(columns=colunas_agrupamento + ['QTD_BENEFICIOS']))
+    return juntar_particoes(particoes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestão incremental das bases mensais do INSS.")
+    parser.add_argument('--bases', default='bases_inss', help="Pasta com os arquivos Excel mensais.")
+    parser.add_argument('--padrao', default='ben_*.xlsx', help="Padrão dos nomes dos arquivos mensais.")
+    parser.add_argument('--particoes', default='output/particoes', help="Pasta das partições mensais e do manifesto.")
+    parser.add_argument('--saida', default='output/base_final.csv', help="Caminho da base final.")
+    parser.add_argument('--compacta', default='output/base_final', help="Pasta da base final compacta (tabela de fatos e dimensões).")
+    parser.add_argument('--cubo', default='output/cubo.parquet', help="Caminho do cubo pré-agregado usado pelo dashboard.")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos de leitura (padrão: núcleos da máquina).")
+    parser.add_argument('--lote', type=int, nargs='?', const=tamanho_lote_padrao, default=None,
+                        help=f"Processa cada arquivo em lotes de linhas (padrão do lote: {tamanho_lote_padrao}); a memória fica limitada a processos x lote.")
+    parser.add_argument('--detalhe', nargs='?', const=pasta_detalhe_padrao, default=None,
+                        help=f"Também grava as linhas tratadas, por mês, para o detalhamento por UF e município (padrão da pasta: {pasta_detalhe_padrao}).")
+    args = parser.parse_args()
+
+    base_tratada = ingerir_incremental(args.bases, args.padrao, args.particoes, args.processos, args.lote, args.detalhe)
+    Path(args.saida).parent.mkdir(parents=True, exist_ok=True)
+    base_tratada.to_csv(args.saida, index=False)
+    print(f"Base final salva em: {args.saida} ({len(base_tratada)} linhas)")
+    salvar_base_compacta(base_tratada, args.compacta)
+    print(f"Base compacta salva em: {args.compacta}")
+    salvar_cubo(gerar_cubo(base_tratada), args.cubo)
+    print(f"Cubo salvo em: {args.cubo}")
+    if args.detalhe:
+        print(f"Base de detalhamento salva em: {args.detalhe}")
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# Liga a instrumentação pela variável de ambiente ou pelo parâmetro da URL (ex.: ?instrumentacao=1)
+variavel_ambiente = 'INSS_INSTRUMENTACAO'
+parametro_url = 'instrumentacao'
+variavel_log = 'INSS_INSTRUMENTACAO_LOG'
+caminho_log_padrao = 'output/instrumentacao.jsonl'
+valores_ligado = {'1', 'true', 'sim', 'on'}
+
+# O tracemalloc vale para o processo inteiro: fica ligado enquanto houver alguma execução instrumentada
+_trava_memoria = threading.Lock()
+_execucoes_memoria = 0
+_memoria_iniciada_aqui = False
+
+
+def ligada(parametros_url=None):
+    """Indica se a instrumentação foi pedida pela variável de ambiente ou pelos parâmetros da URL."""
+    if os.environ.get(variavel_ambiente, '').strip().lower() in valores_ligado:
+        return True
+    valor = (parametros_url or {}).get(parametro_url, '')
+    return str(valor).strip().lower() in valores_ligado
+
+
+def _iniciar_memoria():
+    global _execucoes_memoria, _memoria_iniciada_aqui
+    with _trava_memoria:
+        if _execucoes_memoria == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memoria_iniciada_aqui = True
+        _execucoes_memoria += 1
+
+
+def _encerrar_memoria():
+    global _execucoes_memoria, _memoria_iniciada_aqui
+    with _trava_memoria:
+        _execucoes_memoria -= 1
+        if _execucoes_memoria == 0 and _memoria_iniciada_aqui:
+            tracemalloc.stop()
+            _memoria_iniciada_aqui = False
+
+
+class Instrumentacao:
+    """Mede o tempo e o pico de memória de cada etapa nomeada de uma execução do dashboard.
+
+    Desligada, medir() devolve um contexto vazio e nada é registrado. Ligada, cada etapa
+    guarda o tempo de parede e o pico de memória alocada acima do início da etapa (pelo
+    tracemalloc, que vê as alocações do Python e do numpy; com várias sessões instrumentadas ao mesmo tempo o pico é aproximado).
+    As etapas podem ser aninhadas.
+    """
+
+    def __init__(self, ativa=False, caminho_log=None, origem='pagina'):
+        self.ativa = ativa
+        self.caminho_log = Path(caminho_log or os.environ.get(variavel_log) or caminho_log_padrao)
+        self.medicoes = []
+        self.registradas = 0
+        self.pagina_concluida = False
+        self._pilha = []
+        self.nova_execucao(origem)
+
+    def nova_execucao(self, origem):
+        """Começa uma nova execução (ex.: um fragmento reexecutado depois da página)."""
+        self.registrar_log()
+        self.execucao = uuid.uuid4().hex[:12]
+        self.origem = origem
+        self.medicoes = []
+        self.registradas = 0
+
+    def medir(self, etapa):
+        if not self.ativa:
+            return nullcontext()
+        return self._medir(etapa)
+
+    @contextmanager
+    def _medir(self, etapa):
+        _iniciar_memoria()
+        # O pico do tracemalloc é global: antes de zerá-lo, o pico atual é repassado à etapa externa
+        atual, pico = tracemalloc.get_traced_memory()
+        if self._pilha:
+            self._pilha[-1]['pico'] = max(self._pilha[-1]['pico'], pico)
+        tracemalloc.reset_peak()
+        quadro = {'inicio_memoria': atual, 'pico': atual}
+        self._pilha.append(quadro)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            self._pilha.pop()
+            pico = max(quadro['pico'], tracemalloc.get_traced_memory()[1])
+            if self._pilha:
+                self._pilha[-1]['pico'] = max(self._pilha[-1]['pico'], pico)
+            _encerrar_memoria()
+            self.medicoes.append({
+                'etapa': etapa,
+                'segundos': segundos,
+                'memoria_pico_bytes': pico - quadro['inicio_memoria'],
+                'nivel': len(self._pilha),
+            })
+
+    def tabela(self):
+        """Linhas para exibição: etapa (indentada pelo aninhamento), tempo em ms e pico em MiB."""
+        return [
+            {'Etapa': '  ' * medicao['nivel'] + medicao['etapa'],
+             'Tempo (ms)': round(medicao['segundos'] * 1000, 2),
+             'Pico de memória (MiB)': round(medicao['memoria_pico_bytes'] / 2**20, 2)}
+            for medicao in self.medicoes
+        ]
+
+    def registrar_log(self):
+        """Acrescenta ao log (JSON por linha) as medições ainda não gravadas."""
+        pendentes = self.medicoes[self.registradas:] if self.ativa else []
+        if not pendentes:
+            return
+        instante = datetime.now().isoformat(timespec='milliseconds')
+        self.caminho_log.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.caminho_log, 'a', encoding='utf-8') as arquivo:
+            for medicao in pendentes:
+                registro = {'instante': instante, 'execucao': self.execucao, 'origem': self.origem, **medicao}
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        self.registradas = len(self.medicoes)
+
+
+def resumir_log(caminho_log=caminho_log_padrao, percentis=(0.5, 0.9, 0.99)):
+    """Percentis do tempo (ms) de cada etapa em todas as execuções registradas no log."""
+    registros = pd.read_json(caminho_log, lines=True)
+    tempos = registros.assign(ms=registros['segundos'] * 1000).groupby('etapa')['ms']
+    resumo = tempos.quantile(list(percentis)).unstack()
+    resumo.columns = [f'p{round(percentil * 100)}' for percentil in percentis]
+    resumo.insert(0, 'execucoes', tempos.size())
+    return resumo.sort_values(resumo.columns[-1], ascending=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Resume o log da instrumentação do dashboard em percentis de tempo por etapa.")
+    parser.add_argument('log', nargs='?', default=os.environ.get(variavel_log, caminho_log_padrao))
+    args = parser.parse_args()
+    print(resumir_log(args.log).round(2).to_string())
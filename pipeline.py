@@ -0,0 +1,137 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from armazenamento import salvar_base_compacta
+from carregamento import assinatura_codigo, calcular_chave, hash_arquivo
+from cubo import gerar_cubo, salvar_cubo
+from ingestao import gravar_base_bruta, ler_base_bruta, ler_bases_excel
+from tratamento import agregar_base, calcular_taxa, etapas_tratamento
+
+
+def extrair(arquivos, processos=None):
+    """Lê e junta as bases mensais (colunas_desejadas de cada arquivo).
+
+    Se algum arquivo não puder ser lido, a extração falha em vez de ser salva incompleta
+    no checkpoint, cuja chave inclui o hash de todos os arquivos.
+    """
+    bases = ler_bases_excel(arquivos, processos, separar_mistas=True)
+    if len(bases) != len(arquivos):
+        raise RuntimeError(f"Falha na leitura de {len(arquivos) - len(bases)} de {len(arquivos)} arquivos; a extração não foi salva.")
+    return pd.concat(bases, ignore_index=True)
+
+
+def exportar(base_tratada, destinos):
+    """Grava a base final em CSV, a base compacta e o cubo do dashboard."""
+    Path(destinos['csv']).parent.mkdir(parents=True, exist_ok=True)
+    base_tratada.to_csv(destinos['csv'], index=False)
+    salvar_base_compacta(base_tratada, destinos['compacta'])
+    salvar_cubo(gerar_cubo(base_tratada), destinos['cubo'])
+
+
+# Etapas que recebem a saída da anterior, na ordem do notebook (a extração e a exportação ficam nas pontas)
+etapas_pipeline = [(etapa.__name__, etapa) for etapa in etapas_tratamento] + [('agregar_base', agregar_base), ('calcular_taxa', calcular_taxa)]
+
+
+def caminho_checkpoint(pasta_checkpoints, ordem, nome, chave, extensao='.parquet'):
+    return Path(pasta_checkpoints) / f'{ordem:02d}_{nome}_{chave[:16]}{extensao}'
+
+
+def salvar_checkpoint(base, caminho, bruta=False):
+    # Mantendo apenas o checkpoint mais recente de cada etapa
+    for antigo in caminho.parent.glob(caminho.name.rsplit('_', 1)[0] + '_*'):
+        antigo.unlink()
+    if bruta:
+        gravar_base_bruta(base, caminho)
+        return
+    # Etapas já tratadas são gravadas direto; só uma coluna com tipos misturados (ex.: UF com o número 81
+    # entre as siglas) passa pela separação de gravar_base_bruta
+    try:
+        pq.write_table(pa.Table.from_pandas(base, preserve_index=False), caminho)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        gravar_base_bruta(base, caminho)
+
+
+def executar_pipeline(caminho_bases, padrao_arquivos, pasta_checkpoints, destinos, processos=None, forcar=False):
+    """Executa extração, tratamento, agregação e exportação, reaproveitando os checkpoints válidos.
+
+    A chave de cada etapa é o hash da chave da etapa anterior (na extração, o SHA-256 de cada
+    arquivo) com o código e os parâmetros da etapa. Só as etapas posteriores ao último checkpoint
+    válido são recalculadas, e as anteriores nem são lidas do disco. Devolve o relatório com a
+    situação de cada etapa ('cache' ou 'recalculada') e o tempo gasto nela.
+    """
+    pasta_checkpoints = Path(pasta_checkpoints)
+    pasta_checkpoints.mkdir(parents=True, exist_ok=True)
+    arquivos = sorted(Path(caminho_bases).glob(padrao_arquivos))
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhum arquivo {padrao_arquivos} encontrado em {caminho_bases}")
+
+    # Chaves de todas as etapas, calculadas antes de executar qualquer uma
+    entradas = [(arquivo.name, hash_arquivo(arquivo)) for arquivo in arquivos]
+    etapas = [('extrair', lambda _: extrair(arquivos, processos), calcular_chave(entradas, assinatura_codigo(extrair)))]
+    for nome, funcao in etapas_pipeline:
+        etapas.append((nome, funcao, calcular_chave(etapas[-1][2], assinatura_codigo(funcao))))
+    caminhos = [caminho_checkpoint(pasta_checkpoints, ordem, nome, chave) for ordem, (nome, _, chave) in enumerate(etapas)]
+
+    # Último checkpoint existente: a execução começa a partir dele
+    inicio = 0
+    if not forcar:
+        for ordem in reversed(range(len(etapas))):
+            if caminhos[ordem].exists():
+                inicio = ordem + 1
+                break
+
+    relatorio = []
+    base = None
+    for ordem, (nome, funcao, chave) in enumerate(etapas):
+        comeco = time.perf_counter()
+        if ordem < inicio - 1:
+            situacao = 'cache'
+        elif ordem == inicio - 1:
+            base = ler_base_bruta(caminhos[ordem])
+            situacao = 'cache'
+        else:
+            base = funcao(base)
+            salvar_checkpoint(base, caminhos[ordem], bruta=(ordem == 0))
+            situacao = 'recalculada'
+        relatorio.append({'etapa': nome, 'situacao': situacao, 'chave': chave[:16], 'segundos': time.perf_counter() - comeco})
+
+    # A exportação não tem checkpoint próprio: um marcador registra a chave dos arquivos gravados
+    chave_exportacao = calcular_chave(etapas[-1][2], assinatura_codigo(exportar), destinos)
+    marcador = caminho_checkpoint(pasta_checkpoints, len(etapas), 'exportar', chave_exportacao, '.json')
+    comeco = time.perf_counter()
+    if not forcar and marcador.exists() and all(Path(destino).exists() for destino in destinos.values()):
+        situacao = 'cache'
+    else:
+        base = ler_base_bruta(caminhos[-1]) if base is None else base
+        exportar(base, destinos)
+        for antigo in pasta_checkpoints.glob(marcador.name.rsplit('_', 1)[0] + '_*'):
+            antigo.unlink()
+        marcador.write_text(json.dumps(destinos, ensure_ascii=False), encoding='utf-8')
+        situacao = 'recalculada'
+    relatorio.append({'etapa': 'exportar', 'situacao': situacao, 'chave': chave_exportacao[:16], 'segundos': time.perf_counter() - comeco})
+    return relatorio
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pipeline do notebook em etapas, com checkpoint de cada etapa em disco.")
+    parser.add_argument('--bases', default='bases_inss', help="Pasta com os arquivos Excel mensais.")
+    parser.add_argument('--padrao', default='ben_*.xlsx', help="Padrão dos nomes dos arquivos mensais.")
+    parser.add_argument('--checkpoints', default='output/checkpoints', help="Pasta dos checkpoints das etapas.")
+    parser.add_argument('--saida', default='output/base_final.csv', help="Caminho da base final.")
+    parser.add_argument('--compacta', default='output/base_final', help="Pasta da base final compacta (tabela de fatos e dimensões).")
+    parser.add_argument('--cubo', default='output/cubo.parquet', help="Caminho do cubo pré-agregado usado pelo dashboard.")
+    parser.add_argument('--processos', type=int, default=None, help="Número de processos de leitura (padrão: núcleos da máquina).")
+    parser.add_argument('--forcar', action='store_true', help="Recalcula todas as etapas, ignorando os checkpoints.")
+    args = parser.parse_args()
+
+    destinos = {'csv': args.saida, 'compacta': args.compacta, 'cubo': args.cubo}
+    relatorio = executar_pipeline(args.bases, args.padrao, args.checkpoints, destinos, args.processos, args.forcar)
+    for etapa in relatorio:
+        print(f"{etapa['etapa']:<20} {etapa['situacao']:<12} {etapa['chave']}  {etapa['segundos']:.2f}s")
+    print(f"Recalculadas: {sum(etapa['situacao'] == 'recalculada' for etapa in relatorio)} de {len(relatorio)} etapas")
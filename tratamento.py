@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+
+# Colunas lidas de cada base mensal
+colunas_desejadas = ["Competência concessão", "Espécie_NUM", "Espécie_NOME", "CID_NUM_NOME", "Despacho_NOME", "Dt Nascimento", "Sexo.", "Clientela", "Mun Resid", "Vínculo dependentes", "Forma Filiação", "UF", "Qt SM RMI", "Ramo Atividade", "Dt DCB", "Dt DDB", "Dt DIB", "País de Acordo Internacional", "Classificador PA"]
+
+# Nomes das colunas usados a partir da etapa de renomeação
+mapa_colunas = {'Competência concessão': 'MES', 'Espécie_NOME': 'BENEF_TIPO', 'Despacho_NOME': 'CONCES_TIPO','Dt Nascimento': 'DT_NASCIMENTO','Dt DCB': 'DT_CESSACAO','Dt DDB': 'DT_DESPACHO','Dt DIB': 'DT_INICIO','Sexo.': 'SEXO','Clientela': 'ZONA','Ramo Atividade': 'RAMO','Idade': 'IDADE','Forma Filiação': 'STATUS_BENEFICIARIO','Classificador PA': 'PENSAO_ALIM', 'Vínculo dependentes': 'VINCULO_DEPEND', 'Qt SM RMI': 'QTD_SALARIO_MIN', 'Mun Resid': 'MUNICIPIO'}
+
+colunas_base_final = ['MES','UF','MUNICIPIO','ZONA','BENEF_TIPO','VINCULO_DEPEND','QTD_SALARIO_MIN','CONCES_TIPO','CID_TIPO','DT_INICIO','DT_DESPACHO','DT_CESSACAO','PENSAO_ALIM','TEMPO_BENEF_DIAS','TEMPO_ESPERA_DESPACHO_DIAS','RAMO','SEXO','IDADE','STATUS_BENEFICIARIO']
+
+# Faixas etárias
+bins_idade = [0, 20, 30, 40, 50, 60, 120]
+labels_idade = ['0-20', '21-30', '31-40', '41-50', '51-60', '61+']
+
+# Colunas usadas no agrupamento da base final
+colunas_agrupamento = ['MES','REGIAO_PAIS','CID_TIPO','SEXO','BENEF_TIPO','STATUS_BENEFICIARIO','IDADE_FAIXA']
+
+
+# Categoria do CID pela primeira letra do código
+mapa_cid_letra = {
+    'F': 'Transtornos mentais e comportamentais',
+    'M': 'Doenças osteomusculares',
+    'I': 'Circulatório',
+    'A': 'Doenças infecciosas e parasitárias', 'B': 'Doenças infecciosas e parasitárias',
+    'C': 'Neoplasias (tumores)', 'D': 'Neoplasias (tumores)',
+    'E': 'Doenças endócrinas, nutricionais e metabólicas',
+    'G': 'Doenças do sistema nervoso',
+    'S': 'Traumatismos e envenenamentos', 'T': 'Traumatismos e envenenamentos',
+    'O': 'Gravidez, parto e puerpério',
+}
+
+# Formato das datas em texto nas bases mensais; as datas gravadas como data no Excel já chegam convertidas
+formato_data = '%d/%m/%Y'
+colunas_data = ['Dt DIB', 'Dt DCB', 'Dt DDB']
+# Colunas mistas (datas do Excel junto com textos como '00/00/0000') podem chegar separadas: as datas
+# na própria coluna e os textos em '<coluna>__texto', evitando a coluna de objetos Python
+sufixo_texto = '__texto'
+data_zerada = pd.Timestamp('1900-01-01')
+nanossegundos_dia = 86_400 * 10**9
+
+# Faixas de tempo de benefício (dias) e de salário mínimo: cada limite é o máximo da faixa
+limites_tempo = [31, 90, 180, 365]
+labels_tempo = ['Até 1 mês', 'Acima de 1 mês a 3 meses', 'Acima de 3 meses a 6 meses', 'Acima de 6 meses a 1 ano', 'Mais de 1 ano']
+limites_salario = [1, 3, 5, 10]
+labels_salario = ['Até 1 SM', 'Entre 1 e 3 SM', 'Entre 3 e 5 SM', 'Entre 5 e 10 SM', 'Mais de 10 SM']
+
+# Região de cada estado (nome ou sigla, em minúsculas)
+mapa_estados_regioes = {
+    # Norte
+    'acre': 'Norte', 'ac': 'Norte',
+    'amapa': 'Norte', 'amapá': 'Norte', 'ap': 'Norte',
+    'amazonas': 'Norte', 'am': 'Norte',
+    'para': 'Norte', 'pará': 'Norte', 'pa': 'Norte',
+    'rondonia': 'Norte', 'rondônia': 'Norte', 'ro': 'Norte',
+    'roraima': 'Norte', 'rr': 'Norte',
+    'tocantins': 'Norte', 'to': 'Norte',
+    # Nordeste
+    'alagoas': 'Nordeste', 'al': 'Nordeste',
+    'bahia': 'Nordeste', 'ba': 'Nordeste',
+    'ceara': 'Nordeste', 'ceará': 'Nordeste', 'ce': 'Nordeste',
+    'maranhao': 'Nordeste', 'maranhão': 'Nordeste', 'ma': 'Nordeste',
+    'paraiba': 'Nordeste', 'paraíba': 'Nordeste', 'pb': 'Nordeste',
+    'pernambuco': 'Nordeste', 'pe': 'Nordeste',
+    'piaui': 'Nordeste', 'piauí': 'Nordeste', 'pi': 'Nordeste',
+    'rio grande do norte': 'Nordeste', 'rn': 'Nordeste',
+    'sergipe': 'Nordeste', 'se': 'Nordeste',
+    # Centro-Oeste
+    'goias': 'Centro-Oeste', 'goiás': 'Centro-Oeste', 'go': 'Centro-Oeste',
+    'mato grosso': 'Centro-Oeste', 'mt': 'Centro-Oeste',
+    'mato grosso do sul': 'Centro-Oeste', 'ms': 'Centro-Oeste',
+    'distrito federal': 'Centro-Oeste', 'df': 'Centro-Oeste',
+    # Sudeste
+    'espirito santo': 'Sudeste', 'espírito santo': 'Sudeste', 'es': 'Sudeste',
+    'minas gerais': 'Sudeste', 'mg': 'Sudeste',
+    'rio de janeiro': 'Sudeste', 'rj': 'Sudeste',
+    'sao paulo': 'Sudeste', 'são paulo': 'Sudeste', 'sp': 'Sudeste',
+    # Sul
+    'parana': 'Sul', 'paraná': 'Sul', 'pr': 'Sul',
+    'rio grande do sul': 'Sul', 'rs': 'Sul',
+    'santa catarina': 'Sul', 'sc': 'Sul',
+}
+
+# População por região (ref: jul/2024)
+populacao_regioes = {
+    'Norte': 18669345,
+    'Nordeste': 57112096,
+    'Centro-Oeste': 17071595,
+    'Sudeste': 88617693,
+    'Sul': 31113021,
+}
+
+
+def _mapear_unicos(serie, funcao):
+    # Aplica a função só uma vez por valor distinto e espalha o resultado pelos códigos de cada linha
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    valores = np.array([funcao(valor) for valor in unicos], dtype=object)
+    return pd.Series(valores[codigos], index=serie.index).infer_objects()
+
+
+def _faixas(valores, limites, rotulos):
+    # Valores até limites[i] caem na faixa i; acima do último limite (ou NaN) caem na última faixa
+    indices = np.searchsorted(limites, valores.astype('float64').to_numpy(), side='left')
+    return pd.Series(np.array(rotulos, dtype=object)[indices], index=valores.index)
+
+
+# Agrupando os CIDs em categorias pela primeira letra do código
+def classificar_cid(codigos):
+    return _mapear_unicos(codigos, lambda codigo: mapa_cid_letra.get(str(codigo)[:1], 'Outros'))
+
+
+# Agrupando o tempo de benefício em categorias
+def categorizar_tempo(dias):
+    return _faixas(dias, limites_tempo, labels_tempo)
+
+
+# Agrupando a quantidade de salário mínimo em categorias
+def categorizar_salario(salarios):
+    return _faixas(salarios, limites_salario, labels_salario)
+
+
+# Obtendo a região do estado
+def obter_regiao(estados):
+    return _mapear_unicos(estados, lambda estado: mapa_estados_regioes.get(str(estado).strip().lower(), 'Região não encontrada'))
+
+
+# Obtendo a população por região; regiões desconhecidas recebem o texto '0', como no notebook original
+def categorizar_populacao(regioes):
+    return _mapear_unicos(regioes, lambda regiao: populacao_regioes.get(regiao, '0'))
+
+
+def filtrar_cid(base_completa):
+    """Seleciona apenas as linhas em que a coluna do CID não é zerada ou sem informação."""
+    return base_completa[(base_completa["CID_NUM_NOME"] != 'Zerados') & (base_completa["CID_NUM_NOME"] != '{ñ class}') & (base_completa["CID_NUM_NOME"] != 'Em Branco')].copy()
+
+
+def converter_data(coluna, errors='coerce'):
+    """Converte a coluna para datetime pelo formato fixo; colunas que já são datetime não são relidas.
+
+    Com errors='coerce', textos que não são datas (como o '00/00/0000') viram NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(coluna):
+        return coluna
+    return pd.to_datetime(coluna, format=formato_data, errors=errors)
+
+
+def normalizar_datas(base_inteira):
+    """Converte as colunas de data e descarta as linhas com datas zeradas ('00/00/0000' ou 01/01/1900)."""
+    convertidas = {"Competência concessão": converter_data(base_inteira["Competência concessão"], errors='raise')}
+
+    # Data zerada: valor preenchido que não virou data (sem trocar por '01/01/1900' e comparar textos) ou a própria 01/01/1900
+    zeradas = np.zeros(len(base_inteira), dtype=bool)
+    for coluna in colunas_data:
+        preenchidas = base_inteira[coluna].notna().to_numpy()
+        datas = converter_data(base_inteira[coluna])
+        if coluna + sufixo_texto in base_inteira.columns:
+            # Só as poucas linhas com texto passam pelo formato fixo
+            textos = base_inteira[coluna + sufixo_texto].dropna()
+            datas = datas.copy()
+            datas.loc[textos.index] = converter_data(textos)
+            preenchidas[base_inteira.index.get_indexer(textos.index)] = True
+        zeradas |= (datas.isna().to_numpy() & preenchidas) | (datas == data_zerada).to_numpy()
+        convertidas[coluna] = datas
+
+    # Selecionando apenas as linhas em que as colunas de data não são zeradas ou sem informação;
+    # o take já devolve uma cópia, então a base inteira não é copiada antes do filtro
+    mantidas = np.flatnonzero(~zeradas)
+    base = base_inteira.drop(columns=[coluna + sufixo_texto for coluna in colunas_data], errors='ignore').take(mantidas)
+    for coluna, datas in convertidas.items():
+        base[coluna] = datas.to_numpy()[mantidas]
+    return base
+
+
+def _inteiros(valores, ausentes, index, tipo):
+    # Inteiros compactos; com alguma data ausente, o tipo anulável (Int16/Int32) guarda o <NA>
+    valores = valores.astype(tipo)
+    if ausentes.any():
+        return pd.Series(pd.arrays.IntegerArray(valores, ausentes), index=index)
+    return pd.Series(valores, index=index)
+
+
+def _dias_entre(inicio, fim):
+    # Dias inteiros de inicio até fim (arredondados para baixo, como Timedelta.days) e a máscara de datas ausentes
+    nanossegundos = fim.to_numpy('datetime64[ns]').view(np.int64) - inicio.to_numpy('datetime64[ns]').view(np.int64)
+    return nanossegundos // nanossegundos_dia, inicio.isna().to_numpy() | fim.isna().to_numpy()
+
+
+def dias_entre(inicio, fim):
+    dias, ausentes = _dias_entre(inicio, fim)
+    return _inteiros(dias, ausentes, inicio.index, np.int32)
+
+
+def idade_em_anos(nascimento, referencia):
+    """Idade arredondada, igual a round(dias / 365.25), calculada só com inteiros."""
+    dias, ausentes = _dias_entre(nascimento, referencia)
+    # dias / 365.25 = 4 * dias / 1461; como 8 * dias + 1461 é ímpar, nunca há empate no arredondamento
+    return _inteiros((8 * dias + 1461) // 2922, ausentes, nascimento.index, np.int16)
+
+
+def calcular_duracoes(base_inteira1):
+    """Calcula a idade do beneficiário, o tempo de espera do despacho e o tempo do benefício."""
+    base_inteira1 = base_inteira1.copy()
+    # Idade com base na data de início do benefício e a data de nascimento
+    base_inteira1['Idade'] = idade_em_anos(base_inteira1['Dt Nascimento'], base_inteira1['Dt DIB'])
+    base_inteira1['TEMPO_ESPERA_DESPACHO_DIAS'] = dias_entre(base_inteira1['Dt DIB'], base_inteira1['Dt DDB'])
+    base_inteira1['TEMPO_BENEF_DIAS'] = dias_entre(base_inteira1['Dt DIB'], base_inteira1['Dt DCB'])
+    return base_inteira1
+
+
+def classificar(base_inteira1):
+    """Cria as categorias (CID, status, faixas de tempo, salário e idade) e seleciona as colunas finais."""
+    base_inteira1 = base_inteira1.copy()
+    # Substituindo os status do beneficiário para facilitar os agrupamentos
+    base_inteira1['Forma Filiação'] = base_inteira1['Forma Filiação'].replace({'Empresário': 'Autônomo', 'Equiparado a Autônomo': 'Autônomo', 'Trabalhador Avulso': 'Autônomo'})
+    base_inteira1['CID_TIPO'] = classificar_cid(base_inteira1['CID_NUM_NOME'])
+
+    base_inteira1 = base_inteira1.rename(columns=mapa_colunas)
+    base_completa1 = base_inteira1[colunas_base_final].copy()
+
+    # Indicando se o tempo de espera do despacho é maior que o tempo do benefício
+    base_completa1['TEMPO_ESPERA_MAIOR_BENEF'] = (base_completa1['TEMPO_ESPERA_DESPACHO_DIAS'] >= base_completa1['TEMPO_BENEF_DIAS']).fillna(False).astype(int)
+
+    base_completa1['TEMPO_FAIXA_BENEF'] = categorizar_tempo(base_completa1['TEMPO_BENEF_DIAS'])
+    base_completa1['QTD_SAL_MIN_FAIXA'] = categorizar_salario(base_completa1['QTD_SALARIO_MIN'])
+    base_completa1['IDADE_FAIXA'] = pd.cut(base_completa1['IDADE'], bins=bins_idade, labels=labels_idade, right=True, include_lowest=True)
+    return base_completa1
+
+
+def enriquecer_regiao(base_completa1):
+    """Retira as linhas com UF preenchida errado e acrescenta a região do estado."""
+    base_completa2 = base_completa1[(base_completa1["UF"] != '81')].copy()
+    base_completa2['REGIAO_PAIS'] = obter_regiao(base_completa2['UF'])
+    return base_completa2
+
+
+# Etapas de tratamento das linhas brutas, na ordem em que são aplicadas
+etapas_tratamento = [filtrar_cid, normalizar_datas, calcular_duracoes, classificar, enriquecer_regiao]
+
+
+def tratar_base(base_completa):
+    """Aplica a limpeza e a engenharia de atributos do notebook sobre as linhas brutas."""
+    for etapa in etapas_tratamento:
+        base_completa = etapa(base_completa)
+    return base_completa
+
+
+def agregar_base(base_completa2, observed=False):
+    """Conta os benefícios por combinação das colunas de agrupamento."""
+    return base_completa2.groupby(colunas_agrupamento, observed=observed)['UF'].count().reset_index(name='QTD_BENEFICIOS')
+
+
+def calcular_taxa(base_tratada):
+    """Acrescenta a população da região e a taxa de benefícios por 100 mil habitantes."""
+    base_tratada = base_tratada.copy()
+    base_tratada['POPULACAO'] = categorizar_populacao(base_tratada['REGIAO_PAIS'])
+    base_tratada['TAXA_BENEFICIOS'] = (base_tratada['QTD_BENEFICIOS'] / base_tratada['POPULACAO']) * 100000
+    return base_tratada